@@ -0,0 +1,140 @@
+import sys
+sys.path.append("../")
+
+import time
+
+from utils import *
+
+
+class BenchmarkBookingDecoding:
+    def __init__(self, arguments):
+        self.logger = get_logger()
+        self.bookings = arguments.bookings
+        self.repeats = arguments.repeats
+        self.seed = arguments.seed
+        self.uri = arguments.uri
+
+    def main(self):
+        import bson
+
+        documents = self.synthetic_bookings()
+        if self.uri:
+            # Load raw bookings into a scratch collection and time the aggregation with decoding.
+            from pymongo import MongoClient
+            collection = MongoClient(self.uri).get_database("benchmark").get_collection("bookings")
+            collection.drop()
+            collection.insert_many(documents)
+            get_batches = lambda: collection.aggregate_raw_batches(
+                [{"$project": booking_projection}], batchSize=booking_batch_size
+            )
+            self.logger.info(f"Mock collection: {self.bookings} bookings at {self.uri}.")
+        else:
+            # Encode projected bookings as the raw batches the aggregation would return.
+            projected = [self.project(d) for d in documents]
+            batches = [
+                b"".join(bson.encode(d) for d in projected[i:i + booking_batch_size])
+                for i in range(0, len(projected), booking_batch_size)
+            ]
+            get_batches = lambda: batches
+            self.logger.info(f"In-memory batches: {self.bookings} bookings in {len(batches)} batches.")
+
+        frames, timings = dict(), dict()
+        for decoder in booking_decoders:
+            try:
+                start = time.perf_counter()
+                for _ in range(self.repeats):
+                    frames[decoder] = decode_bookings(get_batches(), decoder=decoder)
+                timings[decoder] = (time.perf_counter() - start) / self.repeats
+            except ImportError as e:
+                self.logger.info(f"{decoder}: unavailable ({e}).")
+                continue
+            self.logger.info(f"{decoder}: {timings[decoder]:.3f}s.")
+        if self.uri:
+            collection.drop()
+
+        # Check decoders agree on every column.
+        if len(frames) == len(booking_decoders):
+            compare_booking_decoders(get_batches())
+            self.logger.info(f"Speedup: {timings['dicts'] / timings['arrow']:.1f}x. Bookings agree.")
+
+    def synthetic_bookings(self):
+        # Raw JDI booking documents (meta and Charges) shaped like the bookings collection.
+        from bson import ObjectId
+
+        rng = np.random.default_rng(self.seed)
+        charge_types = ["Violent", "Property", "Drug", "Public Order", "DUI", "Criminal traffic", "TBD"]
+        first_seen = election_day + pd.to_timedelta(rng.integers(-90, 91, self.bookings), "D")
+        documents = list()
+        for i in range(self.bookings):
+            d = {
+                "_id": ObjectId(),
+                "meta": {
+                    "State": str(rng.choice(states)),
+                    "County": f"County {rng.integers(0, 50)}",
+                    "first_seen": first_seen[i].to_pydatetime(),
+                    "last_seen": (first_seen[i] + dt.timedelta(days=int(rng.geometric(0.1)))).to_pydatetime(),
+                    "jdi_inmate_id": str(rng.integers(0, self.bookings)),
+                },
+                "Name": f"Name {i}",
+                "Age_Standardized": int(rng.integers(16, 80)),
+                "Sex_Gender_Standardized": str(rng.choice(["Male", "Female"])),
+                "Race_Ethnicity_Standardized": str(rng.choice(["White", "Black", "Hispanic", "Unknown Race"])),
+            }
+            if rng.random() < 0.9:
+                d["Charges"] = [
+                    {"Charge_Standardized": {"l1": str(rng.choice(charge_types))}} if rng.random() < 0.9 else {}
+                    for _ in range(rng.geometric(0.5))
+                ]
+            documents.append(d)
+        return documents
+
+    @staticmethod
+    def project(d):
+        # Mirror booking_projection on a raw booking document.
+        projected = {column: d[column] for column in [
+            "_id", "Name", "Age_Standardized", "Sex_Gender_Standardized", "Race_Ethnicity_Standardized"
+        ]}
+        projected.update({
+            "jdi_date_admission": d["meta"]["first_seen"],
+            "jdi_date_release": d["meta"]["last_seen"],
+            "jdi_id_person": d["meta"]["jdi_inmate_id"],
+            "state": d["meta"]["State"],
+            "jail": d["meta"]["County"],
+        })
+        if isinstance(d.get("Charges"), list):
+            projected["jdi_num_charges"] = len(d["Charges"])
+            projected["jdi_charge_types"] = [
+                c["Charge_Standardized"]["l1"] for c in d["Charges"] if "Charge_Standardized" in c
+            ]
+        return projected
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--bookings",
+        type=int,
+        default=200_000,
+        help="Number of synthetic bookings."
+    )
+    parser.add_argument(
+        "-rp", "--repeats",
+        type=int,
+        default=3,
+        help="Number of decodes to time per decoder."
+    )
+    parser.add_argument(
+        "-s", "--seed",
+        type=int,
+        default=0,
+        help="Random seed for synthetic bookings."
+    )
+    parser.add_argument(
+        "-u", "--uri",
+        default=None,
+        help="URI of a local MongoDB in which to load a mock bookings collection (decodes in-memory batches if unset)."
+    )
+    args = parser.parse_args()
+    w = BenchmarkBookingDecoding(args)
+    w.main()
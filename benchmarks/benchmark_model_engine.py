@@ -0,0 +1,124 @@
+import sys
+sys.path.append("../")
+
+import time
+
+from utils import *
+
+
+class BenchmarkModelEngine:
+    def __init__(self, arguments):
+        self.logger = get_logger()
+        self.rows = arguments.rows
+        self.jails = arguments.jails
+        self.repeats = arguments.repeats
+        self.seed = arguments.seed
+
+    def main(self):
+        to_model = self.synthetic_split()
+        self.logger.info(f"Synthetic split: {len(to_model)} records in {self.jails} jails.")
+
+        # Balance design (entity effects) and turnout designs (entity and time effects).
+        for dependent, independent, time_fx in [
+            ("treatment", balance_co_variates, False),
+            ("l2_voted_indicator", ["treatment"], True),
+            ("l2_voted_indicator", ["treatment"] + turnout_co_variates, True),
+        ]:
+            compare_model_engines(to_model, dependent, independent, entity_fx=True, time_fx=time_fx)
+            timings = dict()
+            for engine in model_engines:
+                start = time.perf_counter()
+                for _ in range(self.repeats):
+                    model(
+                        to_model, dependent, independent,
+                        entity_fx=True, time_fx=time_fx, engine=engine, cache_dir=False,
+                    )
+                timings[engine] = (time.perf_counter() - start) / self.repeats
+            self.logger.info(
+                f"{dependent} ~ {len(independent)} variables (time effects: {time_fx}). "
+                f"linearmodels: {timings['linearmodels']:.3f}s. numpy: {timings['numpy']:.3f}s. "
+                f"Speedup: {timings['linearmodels'] / timings['numpy']:.1f}x. Estimates agree."
+            )
+
+        # Four turnout designs of a split fit separately and from one prepared panel.
+        designs = [
+            [independent] + co_variates
+            for independent in ["treatment", "pct_votable_days_in_custody"]
+            for co_variates in [[], turnout_co_variates]
+        ]
+        fits, timings = dict(), dict()
+        for prepared in [False, True]:
+            start = time.perf_counter()
+            for _ in range(self.repeats):
+                if prepared:
+                    to_fit = PreparedPanel(
+                        to_model, ["l2_voted_indicator", "treatment", "pct_votable_days_in_custody"] + turnout_co_variates
+                    )
+                else:
+                    to_fit = to_model
+                fits[prepared] = [
+                    model(
+                        to_fit, "l2_voted_indicator", independent,
+                        entity_fx=True, time_fx=True, engine="numpy", cache_dir=False,
+                    ) for independent in designs
+                ]
+            timings[prepared] = (time.perf_counter() - start) / self.repeats
+        for separate, prepared in zip(fits[False], fits[True]):
+            if not (np.allclose(separate.params, prepared.params) and np.allclose(separate.std_errors, prepared.std_errors)):
+                raise ValueError("Prepared panel estimates disagree with separate fits.")
+        self.logger.info(
+            f"4 turnout designs (numpy). Separate: {timings[False]:.3f}s. Prepared panel: {timings[True]:.3f}s. "
+            f"Speedup: {timings[False] / timings[True]:.1f}x. Estimates agree."
+        )
+
+    def synthetic_split(self):
+        # Indicators, ages, counts and proportions shaped like a Treatment/Control split.
+        rng = np.random.default_rng(self.seed)
+        to_model = pd.DataFrame({
+            "jail_id": rng.integers(0, self.jails, self.rows).astype(str),
+            "week": rng.integers(36, 52, self.rows),
+            "treatment": rng.integers(0, 2, self.rows),
+            "l2_age": rng.integers(18, 90, self.rows).astype(float),
+            "jdi_num_charges": rng.geometric(0.4, self.rows).astype(float),
+            "jdi_length_of_stay": rng.geometric(0.05, self.rows).astype(float),
+            "pct_votable_days_in_custody": rng.random(self.rows),
+        })
+        for column in balance_co_variates:
+            if column not in to_model.columns:
+                to_model[column] = (rng.random(self.rows) < 0.3).astype(float)
+        to_model["l2_voted_indicator"] = (
+            rng.random(self.rows) < 0.4 + 0.003 * (to_model["l2_age"] - 50) - 0.05 * to_model["treatment"]
+        ).astype(float)
+        return to_model.set_index(["jail_id", "week"])
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--rows",
+        type=int,
+        default=200_000,
+        help="Number of synthetic records in the split."
+    )
+    parser.add_argument(
+        "-j", "--jails",
+        type=int,
+        default=1_000,
+        help="Number of synthetic jails (entities)."
+    )
+    parser.add_argument(
+        "-rp", "--repeats",
+        type=int,
+        default=3,
+        help="Number of fits to time per engine and design."
+    )
+    parser.add_argument(
+        "-s", "--seed",
+        type=int,
+        default=0,
+        help="Random seed for synthetic records."
+    )
+    args = parser.parse_args()
+    w = BenchmarkModelEngine(args)
+    w.main()
@@ -0,0 +1,62 @@
+import sys
+sys.path.append("../")
+
+import subprocess
+import time
+
+from utils import *
+
+
+class BenchmarkStartup:
+    def __init__(self, arguments):
+        self.logger = get_logger()
+        self.repeats = arguments.repeats
+        self.root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        # Entry points (directory, script) and a bare import of utils.
+        self.entry_points = [("", "pipeline.py")]
+        for directory in ["matched_bookings", "full_bookings", "figure_generation"]:
+            for script in sorted(os.listdir(os.path.join(self.root, directory))):
+                if script.endswith(".py"):
+                    self.entry_points.append((directory, script))
+
+    def main(self):
+        self.logger.info(f"import utils: {self.time_command(['-c', 'import utils'], self.root):.2f}s.")
+        for directory, script in self.entry_points:
+            # Time interpreter start, imports and argument parsing (-h exits before any work).
+            cwd = os.path.join(self.root, directory)
+            try:
+                seconds = self.time_command([script, "-h"], cwd)
+            except subprocess.CalledProcessError as e:
+                self.logger.info(f"{os.path.join(directory, script)}: failed ({e.stderr.strip().splitlines()[-1]}).")
+                continue
+            self.logger.info(f"{os.path.join(directory, script)}: {seconds:.2f}s.")
+
+    def time_command(self, arguments, cwd):
+        """
+        Runs python with arguments in a fresh interpreter and returns the median wall time over repeats.
+
+        :param (list) arguments: Arguments passed to python.
+        :param (str) cwd: Directory from which to run.
+        :return: Float median seconds.
+        """
+        timings = list()
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + arguments, cwd=cwd, capture_output=True, text=True, check=True)
+            timings.append(time.perf_counter() - start)
+        return float(np.median(timings))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-rp", "--repeats",
+        type=int,
+        default=5,
+        help="Number of startups to time per entry point."
+    )
+    args = parser.parse_args()
+    w = BenchmarkStartup(args)
+    w.main()
@@ -0,0 +1,75 @@
+import sys
+sys.path.append("../")
+
+import time
+
+from utils import *
+
+
+class BenchmarkVotableDays:
+    def __init__(self, arguments):
+        self.logger = get_logger()
+        self.rows = arguments.rows
+        self.row_wise_rows = arguments.row_wise_rows
+        self.seed = arguments.seed
+        self.election_day = election_day
+
+    def main(self):
+        for rows in self.rows:
+            df = self.synthetic_bookings(rows)
+
+            # Time closed-form computation on all rows.
+            start = time.perf_counter()
+            set_votable_days(df)
+            closed_form = time.perf_counter() - start
+
+            # Time row-wise computation on a sample and extrapolate (it is linear in rows).
+            sample = df.head(min(rows, self.row_wise_rows)).copy()
+            start = time.perf_counter()
+            votable_days_row_wise(sample)
+            row_wise = (time.perf_counter() - start) * rows / len(sample)
+
+            self.logger.info(
+                f"Rows: {rows}. Closed form: {closed_form:.2f}s. "
+                f"Row-wise (extrapolated from {len(sample)} rows): {row_wise:.2f}s. "
+                f"Speedup: {row_wise / closed_form:.0f}x."
+            )
+
+    def synthetic_bookings(self, rows):
+        # Admissions within +/- 90 days of Election Day with skewed lengths of stay.
+        rng = np.random.default_rng(self.seed)
+        earliest = pd.to_datetime(["2020-09-04", "2020-09-18", "2020-10-05", "2020-10-13", "2020-10-19"])
+        admission = self.election_day - dt.timedelta(days=90) + pd.to_timedelta(rng.integers(0, 181, rows), unit="D")
+        release = admission + pd.to_timedelta(rng.geometric(0.05, rows) - 1, unit="D")
+        return pd.DataFrame({
+            "earliest_voting_date": earliest[rng.integers(0, len(earliest), rows)],
+            "jdi_date_admission": admission,
+            "jdi_date_release": release,
+        })
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--rows",
+        type=int,
+        nargs="+",
+        default=[1_000_000, 10_000_000],
+        help="Numbers of synthetic booking records to benchmark."
+    )
+    parser.add_argument(
+        "-rw", "--row_wise_rows",
+        type=int,
+        default=20_000,
+        help="Number of records on which to time the row-wise method before extrapolating."
+    )
+    parser.add_argument(
+        "-s", "--seed",
+        type=int,
+        default=0,
+        help="Random seed for synthetic booking records."
+    )
+    args = parser.parse_args()
+    w = BenchmarkVotableDays(args)
+    w.main()
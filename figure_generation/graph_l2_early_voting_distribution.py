@@ -35,17 +35,17 @@ class GraphEarlyVoterDist:
         if self.full:
             self.input_dir_base = "full_bookings"
 
-        # Specify output filename.
+        # Specify output filename and local cache of votes per day from the voter file.
+        self.invalidate_cache = arguments.invalidate_cache
+        self.cache_filename = early_voting_cache_filename
         self.output_html_filename = f"../{self.input_dir_base}/out/figures/{self.path}/l2_early_voting_by_state.html"
 
     def main(self):
-        self.logger.info("Collecting L2 early voting data by state...")
-        dfs = thread(self.get_early_voting_by_state, states)
-        df = pd.concat(dfs)
+        df = self.get_early_voting()
 
         # Remove outliers votes (outside of legal voting days).
         df = set_to_datetime(df)
-        df = df[(df["date"] >= earliest_voting_date) & (df["date"] <= election_day)]
+        df = df[(df["date"] >= get_earliest_voting_date()) & (df["date"] <= election_day)]
 
         # Sum across states.
         df = df.groupby("date")["votes"].sum().reset_index().sort_values(by="date")
@@ -60,45 +60,74 @@ class GraphEarlyVoterDist:
         fig.write_html(self.output_html_filename)
         self.logger.info(f"Saved as: {self.output_html_filename}.")
 
-    def get_early_voting_by_state(self, state):
-        total_voters = self.db.count_documents({
-            "state": state,
-            "filename": "VOTEHISTORY"
-        })
+    def get_early_voting(self):
+        # Read cached votes per day unless invalidated (the voter file is only scanned when not cached).
+        if not self.invalidate_cache and os.path.exists(self.cache_filename):
+            self.logger.info(f"Reading cached L2 early voting data: {self.cache_filename}.")
+            return pd.read_csv(self.cache_filename)
 
-        voters_without_return_date = self.db.count_documents({
-            "state": state,
-            "filename": "VOTEHISTORY",
-            "BallotReturnDate_General_2020_11_03": {"$exists": False},
-        })
+        self.logger.info("Collecting L2 early voting data by state...")
+        df = self.get_early_voting_by_state()
+        os.makedirs(os.path.dirname(self.cache_filename), exist_ok=True)
+        temporary = f"{self.cache_filename}.{os.getpid()}"
+        df.to_csv(temporary, index=False)
+        os.replace(temporary, self.cache_filename)
+        self.logger.info(f"Cached L2 early voting data as: {self.cache_filename}.")
+        return df
 
-        votes_per_day = list(self.db.aggregate([
+    def get_early_voting_by_state(self):
+        # Tally voters, voters without a return date and votes per return date of every state in one pass.
+        tallies = next(self.db.aggregate([
             {"$match": {
-                "state": state,
+                "state": {"$in": states},
                 "filename": "VOTEHISTORY",
-                "BallotReturnDate_General_2020_11_03": {"$exists": True},
             }},
-            {"$group": {
-                "_id": "$BallotReturnDate_General_2020_11_03",
-                "count": {"$sum": 1}
+            {"$facet": {
+                "voters": [
+                    {"$group": {
+                        "_id": "$state",
+                        "total_voters": {"$sum": 1},
+                        "voters_without_return_date": {"$sum": {"$cond": [
+                            {"$eq": [{"$type": "$BallotReturnDate_General_2020_11_03"}, "missing"]}, 1, 0
+                        ]}},
+                    }}
+                ],
+                "votes_per_day": [
+                    {"$match": {"BallotReturnDate_General_2020_11_03": {"$exists": True}}},
+                    {"$group": {
+                        "_id": {"state": "$state", "date": "$BallotReturnDate_General_2020_11_03"},
+                        "count": {"$sum": 1}
+                    }}
+                ],
             }}
-        ]))
-
-        if len(votes_per_day) < 1:
-            return
-
-        for index, record in enumerate(votes_per_day):
-            votes_per_day[index] = {
-                "state": state,
-                "total_voters": total_voters,
-                "date": record["_id"],
+        ], allowDiskUse=True))
+
+        voters = pd.DataFrame(
+            [{
+                "state": record["_id"],
+                "total_voters": record["total_voters"],
+                "voters_without_return_date": record["voters_without_return_date"]
+            } for record in tallies["voters"]],
+            columns=["state", "total_voters", "voters_without_return_date"]
+        ).set_index("state")
+        votes_per_day = pd.DataFrame(
+            [{
+                "state": record["_id"]["state"],
+                "date": record["_id"].get("date"),
                 "votes": record["count"]
-            }
+            } for record in tallies["votes_per_day"]],
+            columns=["state", "date", "votes"]
+        )
 
-        df = pd.DataFrame(votes_per_day)
-        if df["votes"].sum() != total_voters - voters_without_return_date:
-            raise ValueError(f"Issue with vote tally in {state}.")
-        return df
+        # Check each state's votes against its voters with a return date (states without votes are dropped).
+        votes = votes_per_day.groupby("state")["votes"].sum()
+        returned = voters["total_voters"] - voters["voters_without_return_date"]
+        for state in votes.index:
+            if votes[state] != returned.get(state):
+                raise ValueError(f"Issue with vote tally in {state}.")
+
+        df = votes_per_day.join(voters["total_voters"], on="state")
+        return df[["state", "total_voters", "date", "votes"]]
 
 
 if __name__ == "__main__":
@@ -143,6 +172,11 @@ if __name__ == "__main__":
         action="store_true",
         help="Use data for full bookings process (including non-L2 matches)."
     )
+    parser.add_argument(
+        "-ic", "--invalidate_cache",
+        action="store_true",
+        help="Collect L2 early voting data again instead of reading the local cache."
+    )
     args = parser.parse_args()
     w = GraphEarlyVoterDist(args)
     w.main()
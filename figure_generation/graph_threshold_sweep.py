@@ -0,0 +1,98 @@
+import sys
+sys.path.append("../")
+
+import os
+import pandas as pd
+import plotly.express as px
+
+from utils import create_combo_path, get_logger
+
+
+class GraphThresholdSweep:
+    def __init__(self, arguments):
+        self.logger = get_logger()
+        self.input_dir_base = "matched_bookings"
+
+        # Determine input filename from arguments.
+        self.input_dir = f"{self.input_dir_base}/out/threshold_sweep/"
+        self.path = create_combo_path(arguments)
+        self.input_filename = self.input_dir + self.path + ".csv"
+
+        # Set up output filename.
+        if not os.path.exists(f"../{self.input_dir_base}/out/figures"):
+            os.makedirs(f"../{self.input_dir_base}/out/figures")
+        if not os.path.exists(f"../{self.input_dir_base}/out/figures/{self.path}"):
+            os.makedirs(f"../{self.input_dir_base}/out/figures/{self.path}")
+        self.output_dir = f"../{self.input_dir_base}/out/figures/{self.path}"
+
+    def main(self):
+        self.logger.info("Reading in threshold sweep...")
+        df = pd.read_csv("../" + self.input_filename)
+        df = df[df["coefficient"].notna()]  # Thresholds and windows that could not be balanced or modeled.
+        df["95% Confidence"] = 1.96 * df["std_error"]
+        df = df.rename(columns={
+            "threshold": "Match Threshold",
+            "coefficient": "Coefficient",
+            "control_days": "Control Window",
+            "design": "Design",
+            "co_variates": "Co-variates",
+        })
+        df["Control Window"] = df["Control Window"].apply(lambda i: str(i) + " days")
+        fig = px.line(
+            df,
+            x="Match Threshold",
+            y="Coefficient",
+            error_y="95% Confidence",
+            color="Control Window",
+            facet_col="Design",
+            facet_row="Co-variates",
+            markers=True,
+        )
+        fig.update_yaxes(matches=None)
+        fig.add_hline(y=0)
+        fig.update_layout({
+            "plot_bgcolor": "rgba(0, 0, 0, 0)",
+            "paper_bgcolor": "rgba(0, 0, 0, 0)",
+        })
+        fig.write_html(f"{self.output_dir}/threshold_sweep.html")
+        self.logger.info(f"Saved figure as: {self.output_dir}/threshold_sweep.html.")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-a", "--active",
+        action="store_true",
+        help="Only consider voters demarcated as Active by L2."
+    )
+    parser.add_argument(
+        "-c", "--column",
+        choices=["score_weighted", "score_unweighted"],
+        required=True,
+        help="Match probability column on which to threshold data (choose from [score_weighted, score_unweighted])."
+    )
+    parser.add_argument(
+        "-r", "--registered",
+        action="store_true",
+        help="Only consider voters registered prior to Election Day, 2020."
+    )
+    parser.add_argument(
+        "-t", "--threshold",
+        type=float,
+        default=0.5,
+        help="Lowest threshold swept (at least that of the prepped superset)."
+    )
+    parser.add_argument(
+        "-xb", "--exclude_no_bond",
+        action="store_true",
+        help="Only consider voters from jails that report bond amounts."
+    )
+    parser.add_argument(
+        "-xc", "--exclude_no_charge",
+        action="store_true",
+        help="Only consider voters from jails that report charges."
+    )
+    args = parser.parse_args()
+    w = GraphThresholdSweep(args)
+    w.main()
@@ -26,7 +26,7 @@ class TableBalance:
         # Set up output filename.
         if not os.path.exists(f"../{self.input_dir_base}/out/figures"):
             os.makedirs(f"../{self.input_dir_base}/out/figures")
-        if not os.path.exists(f"../{self.input_dir_base}/out/figures"):
+        if not os.path.exists(f"../{self.input_dir_base}/out/figures/{self.path}"):
             os.makedirs(f"../{self.input_dir_base}/out/figures/{self.path}")
         self.output_dir = f"../{self.input_dir_base}/out/figures/{self.path}"
 
@@ -69,12 +69,21 @@ class TableDescriptive:
             self.continuous = ["jdi_age", "jdi_length_of_stay", "jdi_num_charges"]
         self.primary = ["treatment", "pct_votable_days_in_custody", "l2_voted_indicator"]
 
+        # Columns read from each split (matched_registered is derived from matched and registration date).
+        self.columns = [
+            column for column in self.dummies + self.continuous + self.primary if column != "matched_registered"
+        ]
+        if self.full:
+            self.columns += ["l2_date_registered_calculated"]
+
     def main(self):
+        # Read base records shared by all splits once.
+        base_df = load_split_base(self.input_dir, columns=self.columns)
+
         dfs = list()
         for split in self.splits:
             split = (int(split[0]), int(split[1]))
-            to_model = pd.read_csv(self.input_dir + f"/c_{split[0]}/t_{split[1]}.csv", low_memory=False)
-            to_model = set_to_datetime(to_model)
+            to_model = load_split(self.input_dir, *split, base_df=base_df)
 
             if self.full:
                 to_model["matched_registered"] = np.where(
@@ -34,7 +34,7 @@ class TableTurnoutPlacebo:
         dfs = list()
         for d in data:
             df = pd.DataFrame(
-                columns=[f"\\textbf{{Control/Treatment: ({str(d['split'][0])} days, {str(d['split'][1])} days)}}", "", "2016", "2020", "2012", "2020"]
+                columns=[f"\\textbf{{Control/Treatment: ({str(d['split'][0])} days, {str(d['split'][1])} days)}}", ""] + [y["years"][1] for y in d["years"]]
             )
             df.loc[df.shape[0]] = ["Confined During Voting Days", ""] + [signify(y["coefficient"], y["p_value"]) for y in d["years"]]
             df.loc[df.shape[0]] = ["", ""] + [parenthesize(format(y["std_error"], rounding)) for y in d["years"]]
@@ -44,7 +44,8 @@ class TableTurnoutPlacebo:
 
         # Write LaTeX.
         latex = f"\\begin{{tabular}}{{{'l' * len(dfs[0].columns)}}}\n\\toprule\n"
-        latex += "& & \\textbf{2016 Placebo} & & \\textbf{2012 Placebo} & \\\\\n\\midrule\n"
+        placebo_years = [y["years"][0] for y in data[0]["years"][::2]]
+        latex += "& & " + " & ".join(f"\\textbf{{{year} Placebo}} &" for year in placebo_years) + " \\\\\n\\midrule\n"
         for df in dfs:
             latex += " & ".join(df.columns)
             latex += " \\\\\n\\midrule\n"
@@ -23,43 +23,21 @@ class ModelBalanceFull:
         self.output_dir = "out/modeled_balance"
 
     def main(self):
-        # Get the earliest date by control window.
+        # Find the experimental window of each control window from its balance checks.
         splits_df = pd.read_csv(self.input_filename, low_memory=False)
-        controls = splits_df.groupby("control_days")["earliest_date"].min().reset_index()
-
-        # Find the earliest date after which all p-values are <= 0.1 by control window.
-        imbalanced = splits_df[splits_df["p_value"] <= 0.1]
-        imbalanced = imbalanced.groupby("control_days")["earliest_date"].max().reset_index()
-        imbalanced["earliest_date"] = pd.to_datetime(imbalanced["earliest_date"])
-        imbalanced["earliest_date"] = imbalanced["earliest_date"].apply(lambda d: d + dt.timedelta(days=1))
-        imbalanced = imbalanced.rename(columns={"earliest_date": "earliest_viable_date"})
-        treatment_ranges = pd.merge(controls, imbalanced, how="left", on="control_days")
-        treatment_ranges["earliest_viable_date"] = np.where(
-            treatment_ranges["earliest_viable_date"].isna(),
-            treatment_ranges["earliest_date"],
-            treatment_ranges["earliest_viable_date"]
-        )
-        treatment_ranges = treatment_ranges.drop(columns=["earliest_date"])
-        treatment_ranges["earliest_viable_date"] = pd.to_datetime(treatment_ranges["earliest_viable_date"])
-        treatment_ranges["treatment_days"] = (self.election_day - treatment_ranges["earliest_viable_date"]).dt.days
+        treatment_ranges = select_experimental_windows(splits_df)
         treatment_ranges = treatment_ranges[treatment_ranges["treatment_days"] >= 7]
         treatment_ranges.to_csv(self.input_dir + self.path + "/experimental_windows.csv", index=False)
         self.logger.info(f"Saved experimental windows as: {self.input_dir + self.path}/experimental_windows.csv.")
 
-        # Run balance checks for only relevant window pairs.
+        # Report balance checks (fit by balance_iterator.py) for only relevant window pairs.
+        fits = load_fit_summaries(self.input_dir + self.path)
         balance_models = list()
         for split in list(treatment_ranges[["control_days", "treatment_days"]].to_records(index=False)):
             split = (int(split[0]), int(split[1]))
-            to_model = pd.read_csv(self.input_dir + self.path + f"/c_{split[0]}/t_{split[1]}.csv", low_memory=False)
-            to_model = set_to_datetime(to_model)
-            to_model = to_model.set_index(["jail_id", "week"])
-            fit = model(
-                to_model=to_model,
-                dependent="treatment",
-                independent=full_bookings_balance_co_variates,
-                entity_fx=True,
-                time_fx=False,
-            )
+            if split not in fits:
+                raise ValueError(f"No balance fit for split {split} (rerun balance_iterator.py).")
+            fit = fits[split]
 
             # Save fit statistics for this split.
             coefficients = pd.Series({param_map[key]: value for key, value in fit.params.to_dict().items()})
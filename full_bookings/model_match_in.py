@@ -11,6 +11,7 @@ from utils import *
 class ModelMatchFull:
     def __init__(self, arguments):
         self.logger = get_logger()
+        self.engine = arguments.engine
         self.election_day = election_day
 
         # Determine input filename from arguments.
@@ -21,24 +22,34 @@ class ModelMatchFull:
             self.input_dir + "/experimental_windows.csv"
         )[["control_days", "treatment_days"]].to_records(index=False))
 
+        # Columns read from each split.
+        self.columns = [
+            "matched", "l2_date_registered_calculated", "treatment", "pct_votable_days_in_custody"
+        ] + full_bookings_turnout_co_variates
+
         # Set up output directory.
         if not os.path.exists("out/modeled_match_in"):
             os.makedirs("out/modeled_match_in")
         self.output_dir = "out/modeled_match_in"
 
     def main(self):
+        # Read base records shared by all splits once.
+        base_df = load_split_base(self.input_dir, columns=self.columns)
+
         turnout_models = list()
         for split in self.splits:
             split = (int(split[0]), int(split[1]))
-            to_model = pd.read_csv(self.input_dir + f"/c_{split[0]}/t_{split[1]}.csv", low_memory=False)
-            to_model = set_to_datetime(to_model)
-            to_model = to_model.set_index(["jail_id", "week"])
+            to_model = load_split(self.input_dir, *split, base_df=base_df)
 
             to_model["matched_registered"] = np.where(
                 ((to_model["matched"] == 1) & (to_model["l2_date_registered_calculated"] <= self.election_day)), 1, 0
             )
 
             # Set up 4 turnout modeling variations (confinement, proportion of confinement, w/ and w/o co_variates).
+            # Note: the designs share one panel, demeaned once for all of their columns.
+            panel = PreparedPanel(to_model, [
+                "matched_registered", "treatment", "pct_votable_days_in_custody"
+            ] + full_bookings_turnout_co_variates)
             fits = list()
             for design in [
                 ("treatment", "no_co_variates"), ("treatment", "co_variates"),
@@ -48,11 +59,12 @@ class ModelMatchFull:
                 if design[1] == "co_variates":
                     independent += full_bookings_turnout_co_variates
                 fit = model(
-                    to_model=to_model,
+                    to_model=panel,
                     dependent="matched_registered",
                     independent=independent,
                     entity_fx=True,
                     time_fx=True,
+                    engine=self.engine,
                 )
 
                 fits.append({
@@ -113,6 +125,12 @@ if __name__ == "__main__":
         action="store_true",
         help="Only consider voters from jails that report charges."
     )
+    parser.add_argument(
+        "-e", "--engine",
+        choices=model_engines,
+        default="numpy",
+        help="Estimation engine for match-in models (choose from [linearmodels, numpy])."
+    )
     args = parser.parse_args()
     w = ModelMatchFull(args)
     w.main()
@@ -14,8 +14,9 @@ load_dotenv()
 class JdiDataPrep:
     def __init__(self, arguments):
         self.logger = get_logger()
+        self.workers = arguments.workers
         self.db = MongoClient(
-            os.getenv("JDI_CLIENT_URI")
+            os.getenv("JDI_CLIENT_URI"), maxPoolSize=self.workers
         ).get_database(
             os.getenv("JDI_DB")
         ).get_collection(
@@ -29,10 +30,12 @@ class JdiDataPrep:
         self.registered = arguments.registered
         self.no_charge = arguments.exclude_no_charge
         self.no_bond = arguments.exclude_no_bond
+        self.validate_votable_days = arguments.validate_votable_days
+        self.invalidate_cache = arguments.invalidate_cache
         self.election_day = election_day
         self.earliest_date = self.election_day - dt.timedelta(days=90)
         self.latest_date = self.election_day + dt.timedelta(days=90)
-        self.voting_dates_by_state = voting_dates_by_state
+        self.voting_dates_by_state = get_voting_dates_by_state()
 
         # Determine input filename from arguments.
         self.input_dir = "../matched_bookings/out/prepped_data"
@@ -50,15 +53,30 @@ class JdiDataPrep:
 
     def main(self):
         self.logger.info("Reading match data...")
-        match_records = pd.read_csv(self.input_filename, low_memory=False)
+        match_records = set_dtypes(pd.read_csv(self.input_filename, low_memory=False))
         self.logger.info(f"Matched records: {len(match_records)}.")
 
         # Get rosters for sample to pass to bookings collection process.
         rosters = sorted(list(match_records["jail_id"].unique()))
 
-        # Collect bookings from rosters.
+        # Drop cached bookings if requested (all rosters if none are given).
+        if self.invalidate_cache is not None:
+            invalidated = invalidate_cached_bookings(bookings_cache_dir, self.invalidate_cache or None)
+            self.logger.info(f"Invalidated cached bookings of {invalidated} rosters.")
+
+        # Plan queries of admission dates missing from the cache, splitting large rosters into sub-ranges.
         self.logger.info(f"Collecting bookings from {len(rosters)} rosters...")
-        bookings = thread(self.get_bookings, rosters)
+        queries = [query for queries in thread(self.plan_queries, rosters, n=self.workers) for query in queries]
+
+        # Run the largest queries first so no long query starts last.
+        queries = sorted(queries, key=lambda query: query[3], reverse=True)
+        self.logger.info(f"Querying {len(queries)} admission date ranges...")
+        fetched = {roster: list() for roster in rosters}
+        for roster, roster_bookings in thread(self.query_bookings, queries, n=self.workers):
+            fetched[roster].append(roster_bookings)
+
+        # Combine with cached bookings.
+        bookings = thread(self.get_bookings, list(fetched.items()), n=self.workers)
         bookings = pd.concat(bookings)
         self.logger.info(f"Records found: {len(bookings)}.")
 
@@ -79,8 +97,10 @@ class JdiDataPrep:
 
         # Select matched data value in case of column mismatch.
         for column in merge_check_fields:
+            # Note: compare as objects, as categoricals only compare with matching categories.
             bookings[column] = np.where(
-                (bookings[column + "_x"] != bookings[column + "_y"]) & (bookings[column + "_y"].notna()),
+                (bookings[column + "_x"].astype(object) != bookings[column + "_y"].astype(object)) &
+                (bookings[column + "_y"].notna()),
                 bookings[column + "_y"], bookings[column + "_x"]
             )
             bookings = bookings.drop(columns=[column + "_x", column + "_y"])
@@ -106,9 +126,8 @@ class JdiDataPrep:
             "Age_Standardized": "jdi_age",
         })
 
-        # Ensure no issues with jdi_num_charges and jdi_charge_types.
-        assert len(bookings[(bookings["jdi_num_charges"] == 0) & (bookings["jdi_charge_types"].notna())]) == 0
-        assert len(bookings[(bookings["jdi_num_charges"] > 0) & (bookings["jdi_charge_types"].isna())]) == 0
+        # Ensure no issues with jdi_num_charges (bookings with a Charges array list at least one charge).
+        assert len(bookings[bookings["jdi_num_charges"] == 0]) == 0
 
         # Only include people 18 years old at detention.
         self.logger.info("Removing underage voters...")
@@ -124,39 +143,55 @@ class JdiDataPrep:
         bookings["jdi_gender"] = np.where(bookings["jdi_gender"] == "Male", "M", bookings["jdi_gender"])
         bookings["jdi_gender"] = np.where(bookings["jdi_gender"] == "Female", "F", bookings["jdi_gender"])
 
-        # Map most severe charge type.
-        bookings["jdi_charge_types"] = bookings["jdi_charge_types"].fillna("")
-        bookings["jdi_charge_types"] = np.where(bookings["jdi_charge_types"].str.contains("Violent"), "violent", bookings["jdi_charge_types"])
-        bookings["jdi_charge_types"] = np.where(bookings["jdi_charge_types"].str.contains("Property"), "property", bookings["jdi_charge_types"])
-        bookings["jdi_charge_types"] = np.where(bookings["jdi_charge_types"].str.contains("Drug"), "drug", bookings["jdi_charge_types"])
-        bookings["jdi_charge_types"] = np.where(bookings["jdi_charge_types"].str.contains("Public Order"), "public order", bookings["jdi_charge_types"])
-        bookings["jdi_charge_types"] = np.where(bookings["jdi_charge_types"].str.contains("DUI"), "dui", bookings["jdi_charge_types"])
-        bookings["jdi_charge_types"] = np.where(bookings["jdi_charge_types"].str.contains("Criminal traffic"), "criminal traffic", bookings["jdi_charge_types"])
-        bookings["jdi_charge_types"] = np.where(bookings["jdi_charge_types"].str.contains("TBD"), "", bookings["jdi_charge_types"])
-        bookings["jdi_charge_types"] = np.where(bookings["jdi_charge_types"] == "", None, bookings["jdi_charge_types"])
+        # Most severe charge types are classified at collection (see classify_charge_types).
+        bookings["jdi_charge_types"] = bookings["jdi_charge_types"].astype("category")
 
         return bookings
 
-    def get_bookings(self, roster):
-        cursor = list(self.db.find({
+    def plan_queries(self, roster):
+        queries = list()
+        ranges = uncovered_intervals(
+            read_cached_intervals(bookings_cache_dir, roster), self.earliest_date, self.latest_date
+        )
+        while ranges:
+            # Count bookings only up to one more than a task holds, halving ranges with more (sub-ranges share
+            # endpoints and are deduplicated on _id).
+            start, end = ranges.pop()
+            count = self.db.count_documents(self.booking_filter(roster, start, end), limit=booking_task_size + 1)
+            if count > booking_task_size and end - start > dt.timedelta(days=1):
+                middle = start + (end - start) / 2
+                ranges += [(start, middle), (middle, end)]
+            else:
+                queries.append((roster, start, end, count))
+        return queries
+
+    def booking_filter(self, roster, start, end):
+        return {
             "meta.State": roster.split("-", 1)[0],
             "meta.County": roster.split("-", 1)[1],
-            "meta.first_seen": {"$gte": self.earliest_date, "$lte": self.latest_date}
-        }, {field: 1 for field in fields}))
-        for d in cursor:
-            d["jdi_date_admission"] = d["meta"]["first_seen"]
-            d["jdi_date_release"] = d["meta"]["last_seen"]
-            d["jdi_id_person"] = d["meta"]["jdi_inmate_id"]
-            d["state"] = d["meta"]["State"]
-            d["jail"] = d["meta"]["County"]
-            del d["meta"]
-            if "Charges" in d and type(d["Charges"]) == list:
-                d["jdi_num_charges"] = len(d["Charges"])
-                d["jdi_charge_types"] = ";".join(
-                    [c["Charge_Standardized"]["l1"] for c in d["Charges"] if "Charge_Standardized" in c]
-                )
-                del d["Charges"]
-        return pd.DataFrame(cursor)
+            "meta.first_seen": {"$gte": start, "$lte": end}
+        }
+
+    def query_bookings(self, query):
+        roster, start, end, _ = query
+        batches = self.db.aggregate_raw_batches([
+            {"$match": self.booking_filter(roster, start, end)},
+            {"$project": booking_projection},
+        ], batchSize=booking_batch_size)
+        return roster, decode_bookings(batches)
+
+    def get_bookings(self, job):
+        # Add newly queried bookings to the local cache.
+        roster, fetched = job
+        bookings, intervals = read_cached_bookings(bookings_cache_dir, roster)
+        if fetched:
+            bookings = pd.concat(([] if bookings is None else [bookings]) + fetched, ignore_index=True)
+            bookings = bookings.drop_duplicates("_id")
+            write_cached_bookings(bookings_cache_dir, roster, bookings, intervals + [(self.earliest_date, self.latest_date)])
+        return bookings[
+            (bookings["jdi_date_admission"] >= self.earliest_date) &
+            (bookings["jdi_date_admission"] <= self.latest_date)
+        ].reset_index(drop=True)
 
     def recalculate_co_variates(self, bookings, match_records):
         # Recombine roster-level features.
@@ -169,19 +204,7 @@ class JdiDataPrep:
         # Recalculate duration features.
         bookings = set_to_datetime(bookings)
         bookings["jdi_length_of_stay"] = (bookings["jdi_date_release"] - bookings["jdi_date_admission"]).dt.days + 1
-        bookings["votable_days_in_custody"] = bookings.apply(
-            lambda x: len(set(list(
-                pd.date_range(x["earliest_voting_date"], self.election_day)
-            )).intersection(set(list(
-                pd.date_range(x["jdi_date_admission"], x["jdi_date_release"])
-            )))), axis=1
-        )
-        bookings["votable_days"] = bookings.apply(
-            lambda x: len(set(list(
-                pd.date_range(x["earliest_voting_date"], self.election_day)
-            ))), axis=1
-        )
-        bookings["pct_votable_days_in_custody"] = bookings["votable_days_in_custody"] / bookings["votable_days"]
+        bookings = set_votable_days(bookings, validate=self.validate_votable_days)
 
         # Recreate dummy features.
         bookings = self.make_column_dummies(bookings, "jdi_charge_types")
@@ -240,6 +263,23 @@ if __name__ == "__main__":
         action="store_true",
         help="Only consider voters from jails that report charges."
     )
+    parser.add_argument(
+        "-vd", "--validate_votable_days",
+        action="store_true",
+        help="Check closed-form votable days against the row-wise date range method (slow)."
+    )
+    parser.add_argument(
+        "-n", "--workers",
+        type=int,
+        default=15,
+        help="Number of threads querying MongoDB (and size of its connection pool)."
+    )
+    parser.add_argument(
+        "-ic", "--invalidate_cache",
+        nargs="*",
+        default=None,
+        help="Re-collect cached bookings of the given rosters (e.g. AL-Jefferson), or of all rosters if none are given."
+    )
     args = parser.parse_args()
     w = JdiDataPrep(args)
     w.main()
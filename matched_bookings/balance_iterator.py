@@ -13,8 +13,11 @@ class BalanceProcess:
         self.logger = get_logger()
         self.no_charge = arguments.exclude_no_charge
         self.no_bond = arguments.exclude_no_bond
+        self.backend = arguments.backend
+        self.workers = arguments.workers
+        self.prefix_sums = arguments.prefix_sums
         self.election_day = election_day
-        self.earliest_voting_date = earliest_voting_date
+        self.earliest_voting_date = get_earliest_voting_date()
 
         # Determine input filename from arguments.
         self.input_dir = "out/prepped_data/"
@@ -35,27 +38,41 @@ class BalanceProcess:
 
     def main(self):
         self.logger.info(f"Records read: {len(self.base_df)}.")
-        self.base_df = set_to_datetime(self.base_df)
+        self.base_df = set_dtypes(self.base_df)
+        self.split_index = SplitIndex(self.base_df, self.no_charge, self.no_bond)
+
+        # Output base records shared by all splits.
+        save_split_base(self.split_index.base_df, self.output_dir)
         self.logger.info("Processing balance splits...")
 
         # Run through combinations of control windows and treatment rollback days to model balance.
-        balance_checks = thread(self.balance_one_window, list(product(control_windows, range(0, 54))))
+        if self.prefix_sums:
+            balance_checks = thread(self.balance_one_control, control_windows, n=self.workers, backend=self.backend)
+        else:
+            balance_checks = thread(
+                self.balance_one_window,
+                list(product(control_windows, range(0, 54))),
+                n=self.workers,
+                backend=self.backend,
+            )
         balance_checks = list(element for sub_list in balance_checks for element in sub_list)
+
+        # Output fit summaries of every split (read by model_balance.py instead of refitting).
+        save_fit_summaries({
+            (c["control_days"], self.treatment_days(c["rollback_days"])): c.pop("fit") for c in balance_checks
+        }, self.output_dir)
+
+        # Output digests of every split's membership (read by pipeline.py to rerun stages reading splits).
+        save_split_manifest(self.output_dir)
+
         out = pd.DataFrame(balance_checks).sort_values(by=["control_days", "earliest_date"])
         out.to_csv(self.output_dir + "/full_splits.csv", index=False)
         self.logger.info(f"Saved balance results as: {self.output_dir + '/full_splits.csv'}.")
 
     def balance_one_window(self, split):
-        max_voting_window = (self.election_day - self.earliest_voting_date).days
-
         # Split data into treatment and control windows.
-        to_model = treatment_control_split(
-            base_df=self.base_df,
-            control=split[0],
-            treatment_rollback=split[1],
-            no_charge=self.no_charge,
-            no_bond=self.no_bond,
-        )
+        membership = self.split_index.membership(control=split[0], treatment_rollback=split[1])
+        to_model = rebuild_split(self.split_index.base_df, *membership)
 
         # Fit model to prepped data.
         res = model(
@@ -66,11 +83,8 @@ class BalanceProcess:
             time_fx=False,
         )
 
-        # Output prepped modeling data to CSV.
-        if not os.path.exists(self.output_dir + f"/c_{split[0]}"):
-            os.makedirs(self.output_dir + f"/c_{split[0]}")
-        to_model = to_model.reset_index()
-        to_model.to_csv(self.output_dir + f"/c_{split[0]}/t_{max_voting_window - split[1]}.csv", index=False)
+        # Output split membership.
+        self.save_split(split, membership)
 
         # Return relevant statistics for p-value/balance checking.
         return [{
@@ -79,8 +93,38 @@ class BalanceProcess:
             "earliest_date": self.earliest_voting_date + dt.timedelta(days=split[1]),
             "f_statistic": res.f_statistic.stat,
             "p_value": res.f_statistic.pval,
+            "fit": summarize_fit(res),
         }]
 
+    def balance_one_control(self, control):
+        # Fit every treatment rollback for this control window from running sums.
+        fits = balance_by_rollback(self.split_index, control, 54, balance_co_variates)
+
+        balance_checks = list()
+        for fit in fits:
+            split = (control, fit["rollback_days"])
+
+            # Output split membership.
+            self.save_split(split, self.split_index.membership(control=split[0], treatment_rollback=split[1]))
+
+            # Collect relevant statistics for p-value/balance checking.
+            balance_checks.append({
+                "control_days": split[0],
+                "rollback_days": split[1],
+                "earliest_date": self.earliest_voting_date + dt.timedelta(days=split[1]),
+                "f_statistic": fit["f_statistic"],
+                "p_value": fit["p_value"],
+                "fit": summarize_fit(fit["fit"]),
+            })
+        return balance_checks
+
+    def save_split(self, split, membership):
+        save_split(membership, self.output_dir, split[0], self.treatment_days(split[1]))
+
+    def treatment_days(self, rollback):
+        max_voting_window = (self.election_day - self.earliest_voting_date).days
+        return max_voting_window - rollback
+
 
 if __name__ == "__main__":
     import argparse
@@ -117,6 +161,23 @@ if __name__ == "__main__":
         action="store_true",
         help="Only consider voters from jails that report charges."
     )
+    parser.add_argument(
+        "-b", "--backend",
+        choices=parallel_backends,
+        default="threads",
+        help="Executor on which to run balance splits (choose from [threads, processes, serial])."
+    )
+    parser.add_argument(
+        "-n", "--workers",
+        type=int,
+        default=None,
+        help="Number of workers (defaults to 15 threads or one process per CPU)."
+    )
+    parser.add_argument(
+        "-ps", "--prefix_sums",
+        action="store_true",
+        help="Fit all treatment rollbacks of each control window in one pass from running sums."
+    )
     args = parser.parse_args()
     w = BalanceProcess(args)
     w.main()
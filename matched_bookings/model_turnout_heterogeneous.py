@@ -11,6 +11,7 @@ from utils import *
 class ModelTurnoutHeterogeneous:
     def __init__(self, arguments):
         self.logger = get_logger()
+        self.engine = arguments.engine
         self.exclude_modeled_race = arguments.exclude_modeled_race
 
         # Determine input filename from arguments.
@@ -21,6 +22,11 @@ class ModelTurnoutHeterogeneous:
             self.input_dir + "/experimental_windows.csv"
         )[["control_days", "treatment_days"]].to_records(index=False))
 
+        # Columns read from each split.
+        self.columns = [
+            "l2_voted_indicator", "treatment", "pct_votable_days_in_custody", "l2_race", "l2_race_Black", "state"
+        ] + turnout_heterogeneity_co_variates
+
         # Set up output directory.
         if not os.path.exists("out/modeled_turnout_heterogeneous"):
             os.makedirs("out/modeled_turnout_heterogeneous")
@@ -31,12 +37,13 @@ class ModelTurnoutHeterogeneous:
             self.output_dir = "out/modeled_turnout_heterogeneous_race_reporting"
 
     def main(self):
+        # Read base records shared by all splits once.
+        base_df = load_split_base(self.input_dir, columns=self.columns)
+
         turnout_models = list()
         for split in self.splits:
             split = (int(split[0]), int(split[1]))
-            to_model = pd.read_csv(self.input_dir + f"/c_{split[0]}/t_{split[1]}.csv", low_memory=False)
-            to_model = set_to_datetime(to_model)
-            to_model = to_model.set_index(["jail_id", "week"])
+            to_model = load_split(self.input_dir, *split, base_df=base_df)
 
             # Reduce race values to check heterogeneity.
             to_model = to_model[to_model["l2_race"].isin(["Black", "White"])]
@@ -48,16 +55,21 @@ class ModelTurnoutHeterogeneous:
                 to_model = to_model[to_model["state"].isin(race_reporting_states)]
 
             # Set up 4 turnout modeling variations (confinement, proportion of confinement, w/ and w/o co_variates).
+            panel = PreparedPanel(to_model, [
+                "l2_voted_indicator", "treatment", "pct_votable_days_in_custody", "l2_race_Black",
+                "treatment_x_black", "pct_votable_days_in_custody_x_black"
+            ] + turnout_heterogeneity_co_variates)
             fits = list()
             for design in ["treatment", "pct_votable_days_in_custody"]:
                 independent = [design, "l2_race_Black", f"{design}_x_black"]
                 independent += turnout_heterogeneity_co_variates
                 fit = model(
-                    to_model=to_model,
+                    to_model=panel,
                     dependent="l2_voted_indicator",
                     independent=independent,
                     entity_fx=True,
                     time_fx=True,
+                    engine=self.engine,
                 )
                 to_json = {"design": design, "params": list()}
                 for variable in [design, f"{design}_x_black"]:
@@ -139,6 +151,12 @@ if __name__ == "__main__":
         action="store_true",
         help="Only consider voters from states that report l2_race directly (i.e. it is not modeled)."
     )
+    parser.add_argument(
+        "-e", "--engine",
+        choices=model_engines,
+        default="numpy",
+        help="Estimation engine for turnout models (choose from [linearmodels, numpy])."
+    )
     args = parser.parse_args()
     w = ModelTurnoutHeterogeneous(args)
     w.main()
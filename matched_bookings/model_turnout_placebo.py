@@ -11,7 +11,7 @@ from utils import *
 class ModelTurnoutPlacebo:
     def __init__(self, arguments):
         self.logger = get_logger()
-        self.previous_elections = {"2016": dt.datetime(2016, 11, 8, 0, 0), "2012": dt.datetime(2012, 11, 6, 0, 0)}
+        self.engine = arguments.engine
 
         # Determine input filename from arguments.
         self.input_dir = "out/balance_iteration/"
@@ -21,39 +21,47 @@ class ModelTurnoutPlacebo:
             self.input_dir + "/experimental_windows.csv"
         )[["control_days", "treatment_days"]].to_records(index=False))
 
+        # Placebo elections: every earlier general election with L2 vote history (latest first).
+        years = [
+            column.removeprefix("l2_voted_indicator_") for column in split_base_columns(self.input_dir)
+            if column.startswith("l2_voted_indicator_")
+        ]
+        self.previous_elections = {
+            year: general_election_day(int(year))
+            for year in sorted(years, reverse=True) if year.isdigit() and int(year) < election_day.year
+        }
+        self.logger.info(f"Placebo elections: {list(self.previous_elections.keys())}.")
+
+        # Columns read from each split.
+        self.columns = ["l2_voted_indicator", "treatment", "l2_date_registered_calculated"]
+        self.columns += [f"l2_voted_indicator_{year}" for year in self.previous_elections.keys()] + turnout_co_variates
+
         # Set up output directory.
         if not os.path.exists("out/modeled_turnout_placebo"):
             os.makedirs("out/modeled_turnout_placebo")
         self.output_dir = "out/modeled_turnout_placebo"
 
     def main(self):
+        # Read base records shared by all splits once.
+        base_df = load_split_base(self.input_dir, columns=self.columns)
+
         placebo_models = list()
         for split in self.splits:
             split = (int(split[0]), int(split[1]))
-            to_model = pd.read_csv(self.input_dir + f"/c_{split[0]}/t_{split[1]}.csv", low_memory=False)
-            to_model = set_to_datetime(to_model)
-            to_model = to_model.set_index(["jail_id", "week"])
+            to_model = load_split(self.input_dir, *split, base_df=base_df)
 
-            # Set up 4 modeling variations (treatment on 2012 and 2016 turnout, and 2020 turnout for those subsets).
+            # Model treatment on turnout in each earlier election, and 2020 turnout for the same voters.
             years = list()
             for year in self.previous_elections.keys():
                 subset_to_model = to_model[to_model["l2_date_registered_calculated"] <= self.previous_elections[year]]
-                on_self = model(
-                    to_model=subset_to_model,
-                    dependent=f"l2_voted_indicator_{year}",
-                    independent=["treatment"] + turnout_co_variates,
-                    entity_fx=True,
-                    time_fx=False,
-                )
-                on_2020 = model(
+                on_self, on_2020 = model(
                     to_model=subset_to_model,
-                    dependent=f"l2_voted_indicator",
+                    dependent=[f"l2_voted_indicator_{year}", "l2_voted_indicator"],
                     independent=["treatment"] + turnout_co_variates,
                     entity_fx=True,
                     time_fx=False,
+                    engine=self.engine,
                 )
-                if on_self.nobs != on_2020.nobs:
-                    raise ValueError(f"Observations modeled unequal for {year} != 2020.")
                 years.append({
                     "years": (year, year),
                     "coefficient": on_self.params["treatment"],
@@ -121,6 +129,12 @@ if __name__ == "__main__":
         action="store_true",
         help="Only consider voters from jails that report charges."
     )
+    parser.add_argument(
+        "-e", "--engine",
+        choices=model_engines,
+        default="numpy",
+        help="Estimation engine for placebo models (choose from [linearmodels, numpy])."
+    )
     args = parser.parse_args()
     w = ModelTurnoutPlacebo(args)
     w.main()
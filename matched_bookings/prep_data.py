@@ -17,10 +17,12 @@ class MatchDataPrep:
         self.registered = arguments.registered
         self.no_charge = arguments.exclude_no_charge
         self.no_bond = arguments.exclude_no_bond
+        self.validate_votable_days = arguments.validate_votable_days
+        self.superset = arguments.superset
         self.election_day = election_day
         self.earliest_date = self.election_day - dt.timedelta(days=90)
         self.latest_date = self.election_day + dt.timedelta(days=90)
-        self.voting_dates_by_state = voting_dates_by_state
+        self.voting_dates_by_state = get_voting_dates_by_state()
 
         # Log input arguments.
         self.logger.info("Initializing prep_data.py with the following criteria...")
@@ -32,8 +34,8 @@ class MatchDataPrep:
         self.logger.info(f"Filter out no-bond jails? {self.no_bond}.")
         self.logger.info(f"Matched bookings date range: {self.earliest_date.date()} to {self.latest_date.date()}.")
 
-        # Specify input filename.
-        self.input_filename = f"s3://{os.getenv('S3_BUCKET')}/{os.getenv('MATCH_FILE')}"
+        # Specify input file (in S3, read through the local cache).
+        self.input_key = os.getenv("MATCH_FILE")
 
         # Set up output filename.
         if not os.path.exists("out"):
@@ -45,33 +47,59 @@ class MatchDataPrep:
         self.output_filename = self.output_dir + self.path + ".csv"
 
     def main(self):
-        self.logger.info("Reading in matched records...")
-        df = pd.read_csv(self.input_filename, low_memory=False)
-
-        # Subset to desired date range (+/- 90 days).
-        df = self.filter_date_range(df)
-        df = set_to_datetime(df)
+        # Prep the superset of matched records once (or again if requested), then filter it to this configuration.
+        if self.superset or not os.path.exists(prepped_superset_filename):
+            self.prep_superset()
+        if self.superset:
+            return
+
+        self.logger.info(f"Reading prepped superset: {prepped_superset_filename}.")
+        df = set_dtypes(pd.read_csv(prepped_superset_filename, low_memory=False, float_precision="round_trip"))
+        self.logger.info(f"Superset records: {len(df)}.")
+        self.logger.info(f"Thresholding > {self.threshold} on {self.thresholding_column}.")
+        df = prepped_view(
+            df,
+            self.thresholding_column,
+            self.threshold,
+            active=self.active,
+            registered=self.registered,
+            no_charge=self.no_charge,
+            no_bond=self.no_bond,
+        )
         self.logger.info(f"Matched records: {len(df)}.")
 
-        # Merge in earliest voting date by state.
-        df = pd.merge(df, voting_dates_by_state, how="left", on="state")
+        # Check this configuration's votable days against the row-wise method (the superset is left as is).
+        if self.validate_votable_days:
+            df = set_votable_days(df, validate=True)
+            self.logger.info("Votable days validated.")
 
-        # Threshold matches on probability score (from input column).
-        self.logger.info(f"Thresholding > {self.threshold} on {self.thresholding_column}.")
-        df = df[df[self.thresholding_column] > self.threshold]
+        # Output to CSV.
+        df.to_csv(self.output_filename, index=False)
+        self.logger.info(f"Wrote file to CSV:")
+        self.logger.info(f"{self.output_filename}.")
+
+    def prep_superset(self):
+        # Stream used columns of matched records, subsetting each chunk to the desired date range (+/- 90 days) and
+        # thresholding matches on either probability score.
+        self.logger.info("Reading in matched records...")
+        self.logger.info(f"Thresholding > {prepped_superset_threshold} on score_weighted or score_unweighted.")
+        df = read_s3_csv_chunks(
+            self.input_key,
+            self.filter_chunk,
+            usecols=lambda column: column in match_columns or column.startswith("l2_voted_indicator_"),
+            dtype=match_column_dtypes,
+        )
+        df = set_dtypes(df)
         self.logger.info(f"Matched records: {len(df)}.")
 
-        # Subset to active voters if specified (in input).
-        if self.active:
-            self.logger.info("Filtering to L2-Active voters.")
-            df = df[df["l2_active"] == 1]
-            self.logger.info(f"Matched records: {len(df)}.")
+        # Merge in earliest voting date by state.
+        df = pd.merge(df, self.voting_dates_by_state, how="left", on="state")
 
-        # Subset to voters registered pre-Election Day.
-        if self.registered:
-            self.logger.info("Filtering to voters registered by Election Day.")
-            df = df[df["l2_date_registered_calculated"] <= self.election_day]
-            self.logger.info(f"Matched records: {len(df)}.")
+        # Flag active voters and voters registered pre-Election Day.
+        df["flag_active"] = (df["l2_active"] == 1).fillna(False).astype(bool)
+        df["flag_registered"] = df["l2_date_registered_calculated"] <= self.election_day
+        self.logger.info(f"L2-Active voters: {df['flag_active'].sum()}.")
+        self.logger.info(f"Voters registered by Election Day: {df['flag_registered'].sum()}.")
 
         # Create length of stay (LOS) feature.
         df["jdi_length_of_stay"] = (df["jdi_date_release"] - df["jdi_date_admission"]).dt.days + 1
@@ -80,46 +108,8 @@ class MatchDataPrep:
         df = simplify_l2_race(df)
         df = simplify_l2_party(df)
 
-        # Subset to voters from jails that report charges.
-        if self.no_charge:
-            # First, find and exclude jails that have only 0 jdi_num_charges.
-            num_charges = df.groupby("jail_id")["jdi_num_charges"].unique().reset_index()
-            num_charges["num_charges"] = num_charges["jdi_num_charges"].apply(lambda l: sum(l))
-            zero_charges = num_charges[num_charges["num_charges"] == 0]["jail_id"].unique()
-            df = df[~df["jail_id"].isin(zero_charges)]
-            self.logger.info(f"Excluded records from {len(zero_charges)} jails with no charge data.")
-            self.logger.info(f"Matched records: {len(df)}.")
-
-            # Second, find and exclude jails with no charge types.
-            charge_types = df.groupby("jail_id")["jdi_charge_types"].unique().reset_index()
-            charge_types["missing"] = charge_types["jdi_charge_types"].apply(lambda l: pd.isna(l).all())
-            missing_charge_types = charge_types[charge_types["missing"]]["jail_id"].unique()
-            df = df[~df["jail_id"].isin(missing_charge_types)]
-            self.logger.info(f"Excluded records from {len(missing_charge_types)} jails with no charge types.")
-            self.logger.info(f"Matched records: {len(df)}.")
-
-        # Subset to voters from jails that report bond amounts.
-        if self.no_bond:
-            total_bond = df.groupby("jail_id")["jdi_bond"].sum().reset_index()
-            missing_bond = total_bond[total_bond["jdi_bond"] == 0]["jail_id"].unique()
-            df = df[~df["jail_id"].isin(missing_bond)]
-            self.logger.info(f"Excluded records from {len(missing_bond)} jails with no bond data.")
-            self.logger.info(f"Matched records: {len(df)}.")
-
         # Set up independent variable columns.
-        df["votable_days_in_custody"] = df.apply(
-            lambda x: len(set(list(
-                pd.date_range(x["earliest_voting_date"], self.election_day)
-            )).intersection(set(list(
-                pd.date_range(x["jdi_date_admission"], x["jdi_date_release"])
-            )))), axis=1
-        )
-        df["votable_days"] = df.apply(
-            lambda x: len(set(list(
-                pd.date_range(x["earliest_voting_date"], self.election_day)
-            ))), axis=1
-        )
-        df["pct_votable_days_in_custody"] = df["votable_days_in_custody"] / df["votable_days"]
+        df = set_votable_days(df)
 
         # Create dummy columns for categorical features.
         for column in dummy_columns:
@@ -128,10 +118,19 @@ class MatchDataPrep:
         # Replace spaces and hyphens in columns to appease PanelOLS.from_formula.
         df.columns = [s.replace(" ", "_").replace("-", "_") for s in df.columns]
 
-        # Output to CSV.
-        df.to_csv(self.output_filename, index=False)
-        self.logger.info(f"Wrote file to CSV:")
-        self.logger.info(f"{self.output_filename}.")
+        # Output to CSV (through a temporary file, so configurations never read a partial superset).
+        temporary = f"{prepped_superset_filename}.{os.getpid()}"
+        df.to_csv(temporary, index=False)
+        os.replace(temporary, prepped_superset_filename)
+        self.logger.info(f"Wrote prepped superset to CSV:")
+        self.logger.info(f"{prepped_superset_filename}.")
+
+    def filter_chunk(self, df):
+        df = self.filter_date_range(df)
+        return df[
+            (df["score_weighted"] > prepped_superset_threshold) |
+            (df["score_unweighted"] > prepped_superset_threshold)
+        ]
 
     def filter_date_range(self, df):
         df["jdi_date_admission"] = pd.to_datetime(df["jdi_date_admission"])
@@ -152,7 +151,6 @@ if __name__ == "__main__":
     parser.add_argument(
         "-c", "--column",
         choices=["score_weighted", "score_unweighted"],
-        required=True,
         help="Match probability column on which to threshold data (choose from [score_weighted, score_unweighted])."
     )
     parser.add_argument(
@@ -176,6 +174,18 @@ if __name__ == "__main__":
         action="store_true",
         help="Only consider voters from jails that report charges."
     )
+    parser.add_argument(
+        "-vd", "--validate_votable_days",
+        action="store_true",
+        help="Check this configuration's closed-form votable days against the row-wise method (slow)."
+    )
+    parser.add_argument(
+        "-s", "--superset",
+        action="store_true",
+        help="Only (re-)prep the superset of matched records that configurations filter (e.g. after match file change)."
+    )
     args = parser.parse_args()
+    if args.column is None and not args.superset:
+        parser.error("the following arguments are required: -c/--column")
     w = MatchDataPrep(args)
     w.main()
@@ -0,0 +1,230 @@
+import sys
+sys.path.append("../")
+
+import os
+
+from utils import *
+
+
+class ThresholdSweep:
+    def __init__(self, arguments):
+        self.logger = get_logger()
+        self.column = arguments.column
+        self.active = arguments.active
+        self.registered = arguments.registered
+        self.no_charge = arguments.exclude_no_charge
+        self.no_bond = arguments.exclude_no_bond
+        self.backend = arguments.backend
+        self.workers = arguments.workers
+        self.engine = arguments.engine
+        self.election_day = election_day
+        self.earliest_voting_date = get_earliest_voting_date()
+        self.max_voting_window = (self.election_day - self.earliest_voting_date).days
+
+        # Thresholds from the lowest to the highest, rounded to the step.
+        decimals = len(str(arguments.threshold_step).split(".")[-1])
+        thresholds = np.arange(
+            arguments.threshold, arguments.threshold_max + arguments.threshold_step / 2, arguments.threshold_step
+        )
+        self.thresholds = [round(float(t), decimals) for t in thresholds]
+
+        # Determine output filename from arguments (all thresholds are filtered from the prepped superset).
+        self.path = create_combo_path(arguments)
+
+        # Read in data.
+        self.superset_df = pd.read_csv(prepped_superset_filename, low_memory=False, float_precision="round_trip")
+
+        # Set up output directory.
+        if not os.path.exists("out/threshold_sweep"):
+            os.makedirs("out/threshold_sweep")
+        self.output_dir = "out/threshold_sweep"
+
+    def main(self):
+        self.logger.info(f"Records read: {len(self.superset_df)}.")
+        self.superset_df = set_dtypes(self.superset_df)
+        self.logger.info(
+            f"Sweeping {len(self.thresholds)} thresholds on {self.column} "
+            f"({self.thresholds[0]} to {self.thresholds[-1]})..."
+        )
+
+        # Balance and model turnout at each threshold from the same prepped superset.
+        sweep = thread(self.sweep_one, self.thresholds, n=self.workers, backend=self.backend)
+        out = pd.DataFrame([element for sub_list in sweep for element in sub_list])
+        out = out.sort_values(by=["threshold", "control_days", "design", "co_variates"])
+        out.to_csv(f"{self.output_dir}/{self.path}.csv", index=False)
+        self.logger.info(f"Saved threshold sweep as: {self.output_dir}/{self.path}.csv.")
+
+    def sweep_one(self, threshold):
+        # Filter the superset to this threshold's records (redoing jail-level exclusions on them).
+        df = prepped_view(
+            self.superset_df,
+            self.column,
+            threshold,
+            active=self.active,
+            registered=self.registered,
+            no_charge=self.no_charge,
+            no_bond=self.no_bond,
+        )
+
+        # Skip thresholds without records, or whose records lack a co-variate's dummy column (no record with that
+        # value above them).
+        if df.empty:
+            self.logger.warning(f"Threshold {threshold}: no records, skipping.")
+            return [self.failed_row(threshold, 0)]
+        missing = [column for column in balance_co_variates + turnout_co_variates if column not in df.columns]
+        if missing:
+            self.logger.warning(f"Threshold {threshold}: no records with {sorted(set(missing))}, skipping.")
+            return [self.failed_row(threshold, len(df))]
+
+        # Check balance of every control window and treatment rollback from running sums and pick windows (the split
+        # index and rollbacks are rebuilt per threshold, as each keeps different records).
+        try:
+            split_index = SplitIndex(df, self.no_charge, self.no_bond)
+            balance_checks = list()
+            for control in control_windows:
+                for fit in balance_by_rollback(split_index, control, 54, balance_co_variates):
+                    balance_checks.append({
+                        "control_days": control,
+                        "earliest_date": self.earliest_voting_date + dt.timedelta(days=fit["rollback_days"]),
+                        "p_value": fit["p_value"],
+                    })
+            treatment_ranges = select_experimental_windows(pd.DataFrame(balance_checks))
+        except ValueError as e:
+            self.logger.warning(f"Threshold {threshold}: balance failed, skipping ({e}).")
+            return [self.failed_row(threshold, len(df))]
+
+        # Model 4 turnout variations (as in model_turnout.py) for each experimental window.
+        sweep = list()
+        for split in list(treatment_ranges[["control_days", "treatment_days"]].to_records(index=False)):
+            split = (int(split[0]), int(split[1]))
+            try:
+                sweep += self.model_split(threshold, len(df), split_index, split)
+            except ValueError as e:
+                self.logger.warning(f"Threshold {threshold}, window {split}: models failed, skipping ({e}).")
+                sweep += [self.failed_row(threshold, len(df), split, design) for design in turnout_designs]
+        self.logger.info(f"Threshold {threshold}: {len(df)} records, {len(treatment_ranges)} windows.")
+        return sweep
+
+    def model_split(self, threshold, records, split_index, split):
+        to_model = split_index.split(control=split[0], treatment_rollback=self.max_voting_window - split[1])
+        panel = PreparedPanel(
+            to_model, ["l2_voted_indicator", "treatment", "pct_votable_days_in_custody"] + turnout_co_variates
+        )
+        control = to_model[to_model["treatment"] == 0]
+        if len(control) == 0:
+            raise ValueError("no control records")
+        mean_control_turnout = len(control[control["l2_voted_indicator"] == 1]) / len(control)
+
+        rows = list()
+        for design in turnout_designs:
+            independent = [design[0]]
+            if design[1] == "co_variates":
+                independent += turnout_co_variates
+            fit = model(
+                to_model=panel,
+                dependent="l2_voted_indicator",
+                independent=independent,
+                entity_fx=True,
+                time_fx=True,
+                engine=self.engine,
+            )
+            rows.append({
+                "threshold": threshold,
+                "records": records,
+                "control_days": split[0],
+                "treatment_days": split[1],
+                "design": design[0],
+                "co_variates": design[1],
+                "coefficient": fit.params[design[0]],
+                "std_error": fit.std_errors[design[0]],
+                "p_value": fit.pvalues[design[0]],
+                "observations": fit.nobs,
+                "mean_control_turnout": mean_control_turnout,
+            })
+        return rows
+
+    @staticmethod
+    def failed_row(threshold, records, split=(np.nan, np.nan), design=(np.nan, np.nan)):
+        # Row of missing estimates for a threshold (or window and design) that could not be balanced or modeled.
+        return {
+            "threshold": threshold,
+            "records": records,
+            "control_days": split[0],
+            "treatment_days": split[1],
+            "design": design[0],
+            "co_variates": design[1],
+            "coefficient": np.nan,
+            "std_error": np.nan,
+            "p_value": np.nan,
+            "observations": np.nan,
+            "mean_control_turnout": np.nan,
+        }
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-a", "--active",
+        action="store_true",
+        help="Only consider voters demarcated as Active by L2."
+    )
+    parser.add_argument(
+        "-c", "--column",
+        choices=["score_weighted", "score_unweighted"],
+        required=True,
+        help="Match probability column on which to threshold data (choose from [score_weighted, score_unweighted])."
+    )
+    parser.add_argument(
+        "-r", "--registered",
+        action="store_true",
+        help="Only consider voters registered prior to Election Day, 2020."
+    )
+    parser.add_argument(
+        "-t", "--threshold",
+        type=float,
+        default=0.5,
+        help="Lowest threshold swept (at least that of the prepped superset; run prep_data.py -s first)."
+    )
+    parser.add_argument(
+        "-tm", "--threshold_max",
+        type=float,
+        default=0.99,
+        help="Highest threshold swept."
+    )
+    parser.add_argument(
+        "-ts", "--threshold_step",
+        type=float,
+        default=0.01,
+        help="Step between thresholds swept."
+    )
+    parser.add_argument(
+        "-xb", "--exclude_no_bond",
+        action="store_true",
+        help="Only consider voters from jails that report bond amounts."
+    )
+    parser.add_argument(
+        "-xc", "--exclude_no_charge",
+        action="store_true",
+        help="Only consider voters from jails that report charges."
+    )
+    parser.add_argument(
+        "-b", "--backend",
+        choices=parallel_backends,
+        default="threads",
+        help="Executor on which to run thresholds (choose from [threads, processes, serial])."
+    )
+    parser.add_argument(
+        "-n", "--workers",
+        type=int,
+        default=None,
+        help="Number of workers (defaults to 15 threads or one process per CPU)."
+    )
+    parser.add_argument(
+        "-e", "--engine",
+        choices=model_engines,
+        default="numpy",
+        help="Estimation engine for turnout models (choose from [linearmodels, numpy])."
+    )
+    args = parser.parse_args()
+    w = ThresholdSweep(args)
+    w.main()
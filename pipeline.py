@@ -0,0 +1,412 @@
+import hashlib
+import json
+import runpy
+import sys
+
+from argparse import Namespace
+from multiprocessing.connection import wait
+
+from utils import *
+
+
+class Stage:
+    """
+    One script run of the pipeline with the files it reads and writes (paths relative to the repository root).
+    """
+
+    def __init__(self, directory, script, arguments, inputs, outputs):
+        """
+        :param (str) directory: Directory from which the script is run (e.g. matched_bookings).
+        :param (str) script: Script filename within directory.
+        :param (list) arguments: Command line arguments passed to the script.
+        :param (list) inputs: Files read by the script.
+        :param (list) outputs: Files written by the script.
+        """
+        self.directory = directory
+        self.script = script
+        self.arguments = arguments
+        self.inputs = inputs
+        self.outputs = outputs
+        self.name = " ".join([f"{directory}/{script}"] + arguments)
+        self.cpus = pipeline_stage_cpus.get(script, 1)
+
+
+class ResourceBudget:
+    """
+    CPU and memory budget shared by configuration chains running in separate processes.
+
+    A stage waits until its CPUs and memory are free. Requests beyond the whole budget are capped at it, so such a
+    stage runs once everything else has finished instead of waiting forever.
+    """
+
+    def __init__(self, cpus, memory, context):
+        """
+        :param (int) cpus: Number of CPUs available to all chains.
+        :param (float) memory: Bytes of memory available to all chains.
+        :param context: multiprocessing context in which chains run.
+        """
+        self.total = (float(cpus), float(memory))
+        self.free = context.RawArray("d", self.total)
+        self.condition = context.Condition()
+
+    def acquire(self, cpus, memory):
+        """
+        Blocks until the requested CPUs and memory are free and takes them.
+
+        :param (float) cpus: Number of CPUs requested.
+        :param (float) memory: Bytes of memory requested.
+        :return: Tuple of CPUs and memory taken (to pass to release).
+        """
+        cpus, memory = min(cpus, self.total[0]), min(memory, self.total[1])
+        with self.condition:
+            while self.free[0] < cpus or self.free[1] < memory:
+                self.condition.wait()
+            self.free[0] -= cpus
+            self.free[1] -= memory
+        return cpus, memory
+
+    def release(self, cpus, memory):
+        """
+        Returns CPUs and memory taken by acquire and wakes waiting chains.
+
+        :param (float) cpus: Number of CPUs taken.
+        :param (float) memory: Bytes of memory taken.
+        """
+        with self.condition:
+            self.free[0] += cpus
+            self.free[1] += memory
+            self.condition.notify_all()
+
+
+def run_chain(arguments, configuration, budget):
+    """
+    Runs one configuration chain (target of chain processes).
+
+    :param arguments: Python argparse NameSpace of pipeline.py.
+    :param (dict) configuration: Configuration from pipeline_configurations.
+    :param (ResourceBudget) budget: Budget shared with other chains.
+    """
+    Pipeline(arguments).run_chain(configuration, budget)
+
+
+class Pipeline:
+    def __init__(self, arguments):
+        self.logger = get_logger()
+        self.arguments = arguments
+        self.force = arguments.force
+        self.dry_run = arguments.dry_run
+        self.jobs = arguments.jobs or len(pipeline_configurations)
+        self.cpus = arguments.cpus or os.cpu_count()
+        self.memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        if arguments.memory:
+            self.memory = arguments.memory * 1024 ** 3
+        self.root = os.path.dirname(os.path.abspath(__file__))
+
+    def main(self):
+        # Prep the superset of matched records filtered by all configurations.
+        stale = self.run_stages([self.superset_stage()], "superset")
+
+        # Run configuration chains one after another, or concurrently within the CPU and memory budget.
+        if self.dry_run or self.jobs == 1:
+            for configuration in pipeline_configurations:
+                self.run_chain(configuration, stale=stale)
+            return
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+        budget = ResourceBudget(self.cpus, self.memory, context)
+        self.logger.info(f"Running {len(pipeline_configurations)} chains ({self.jobs} at a time) within "
+                         f"{self.cpus} CPUs and {self.memory / 1024 ** 3:.1f} GB.")
+        pending, running, failed = list(pipeline_configurations), dict(), list()
+        while pending or running:
+            # Start chains up to the number of jobs, then wait for any to finish.
+            while pending and len(running) < self.jobs:
+                configuration = pending.pop(0)
+                chain = context.Process(target=run_chain, args=(self.arguments, configuration, budget))
+                chain.start()
+                running[chain.sentinel] = (configuration, chain)
+            for sentinel in wait(list(running)):
+                configuration, chain = running.pop(sentinel)
+                chain.join()
+                if chain.exitcode != 0:
+                    failed.append(create_combo_path(Namespace(**configuration)))
+        if failed:
+            raise RuntimeError(f"Pipeline chains failed: {failed}.")
+
+    def run_chain(self, configuration, budget=None, stale=None):
+        """
+        Runs one configuration's stages in dependency order, skipping stages whose outputs are current.
+
+        :param (dict) configuration: Configuration from pipeline_configurations.
+        :param (ResourceBudget) budget: Budget shared with concurrently running chains (None if run alone).
+        :param (set) stale: Files of shared stages that would be rewritten (in a dry run).
+        """
+        path = create_combo_path(Namespace(**configuration))
+        self.run_stages(self.configuration_stages(configuration), path, budget, stale)
+
+        # Release in-memory frames of this configuration.
+        frame_cache.clear()
+
+    def run_stages(self, stages, name, budget=None, stale=None):
+        """
+        Runs stages in order, skipping stages whose outputs are current.
+
+        :param (list) stages: Stage objects in dependency order.
+        :param (str) name: Name of the state file recording the stages' runs.
+        :param (ResourceBudget) budget: Budget shared with concurrently running chains (None if run alone).
+        :param (set) stale: Files of upstream stages that would be rewritten (in a dry run).
+        :return: Set of files that would be rewritten (in a dry run).
+        """
+        # Read state of previous runs (stage fingerprints and file hashes).
+        self.state_filename = os.path.join(self.root, f"out/pipeline_state/{name}.json")
+        self.state = {"files": dict(), "stages": dict()}
+        if os.path.exists(self.state_filename):
+            with open(self.state_filename, "r") as state_json:
+                self.state = json.load(state_json)
+
+        stale = set(stale or [])
+        for stage in stages:
+            upstream_stale = any(filename in stale for filename in stage.inputs)
+            if not self.force and not upstream_stale and self.is_current(stage):
+                self.logger.info(f"Current: {stage.name}.")
+                continue
+            if self.dry_run:
+                self.logger.info(f"Stale: {stage.name}.")
+                stale.update(stage.outputs)
+                continue
+            taken = budget.acquire(stage.cpus, self.memory_estimate(stage)) if budget is not None else None
+            try:
+                self.logger.info(f"Running: {stage.name}.")
+                self.run(stage)
+            finally:
+                if taken is not None:
+                    budget.release(*taken)
+            self.record(stage)
+        return stale
+
+    def memory_estimate(self, stage):
+        """
+        Estimates a stage's peak memory from the size of its largest input or output file (outputs from a previous
+        run stand in for data read from remote sources, which have no local inputs).
+
+        :param (Stage) stage: Stage to estimate.
+        :return: Float bytes of memory.
+        """
+        size = 0
+        for filename in stage.inputs + stage.outputs:
+            path = os.path.join(self.root, filename)
+            if os.path.exists(path):
+                size = max(size, os.path.getsize(path))
+        return max(pipeline_memory_factor * size, pipeline_memory_minimum)
+
+    def superset_stage(self):
+        """
+        Builds the stage prepping the superset of matched records (see prepped_view).
+
+        :return: Stage object.
+        """
+        return Stage("matched_bookings", "prep_data.py", ["-s"], [], [
+            f"matched_bookings/{prepped_superset_filename}"
+        ])
+
+    def configuration_stages(self, configuration):
+        """
+        Lists the stages of one configuration in dependency order (as in execute.sh, followed by figures).
+
+        :param (dict) configuration: Configuration with keys of the common script arguments and full.
+        :return: List of Stage objects.
+        """
+        arguments = ["-c", configuration["column"], "-t", str(configuration["threshold"])]
+        for key, flag in [("active", "-a"), ("registered", "-r"), ("exclude_no_bond", "-xb"),
+                          ("exclude_no_charge", "-xc")]:
+            if configuration[key]:
+                arguments.append(flag)
+        path = create_combo_path(Namespace(**configuration))
+        prepped = f"matched_bookings/out/prepped_data/{path}.csv"
+        stages = [Stage("matched_bookings", "prep_data.py", arguments, self.superset_stage().outputs, [prepped])]
+
+        # Matched (or full) bookings balance and modeling.
+        base = "full_bookings" if configuration["full"] else "matched_bookings"
+        balance = f"{base}/out/balance_iteration/{path}"
+        splits = [f"{balance}/experimental_windows.csv", f"{balance}/base.parquet", f"{balance}/splits.json"]
+        if configuration["full"]:
+            merged = f"full_bookings/out/prepped_data/{path}/merged.csv"
+            stages.append(Stage(base, "prep_data.py", arguments, [prepped], [merged]))
+            prepped = merged
+        stages += [
+            Stage(base, "balance_iterator.py", arguments + ["-n", str(pipeline_stage_cpus["balance_iterator.py"])], [
+                prepped
+            ], [
+                f"{balance}/full_splits.csv", f"{balance}/fit_summaries.json", splits[1], splits[2]
+            ]),
+            Stage(base, "model_balance.py", arguments, [
+                f"{balance}/full_splits.csv", f"{balance}/fit_summaries.json"
+            ], [
+                splits[0], f"{base}/out/modeled_balance/{path}.json"
+            ]),
+            Stage(base, "model_turnout.py", arguments, splits, [f"{base}/out/modeled_turnout/{path}.json"]),
+        ]
+        if configuration["full"]:
+            stages.append(Stage(base, "model_match_in.py", arguments, splits, [
+                f"{base}/out/modeled_match_in/{path}.json"
+            ]))
+        else:
+            stages += [
+                Stage(base, "model_turnout_placebo.py", arguments, splits, [
+                    f"{base}/out/modeled_turnout_placebo/{path}.json"
+                ]),
+                Stage(base, "model_turnout_heterogeneous.py", arguments, splits, [
+                    f"{base}/out/modeled_turnout_heterogeneous/{path}.json"
+                ]),
+                Stage(base, "model_turnout_heterogeneous.py", arguments + ["-xr"], splits, [
+                    f"{base}/out/modeled_turnout_heterogeneous_race_reporting/{path}.json"
+                ]),
+            ]
+
+        # Tables and figures (graph_l2_early_voting_distribution.py queries the L2 lake and is run separately).
+        figures = f"{base}/out/figures/{path}"
+        full = ["-f"] if configuration["full"] else []
+        stages += [
+            Stage("figure_generation", "table_descriptive_stats.py", arguments + full, splits, [
+                f"{figures}/table_descriptive_stats.txt"
+            ]),
+            Stage("figure_generation", "table_balance.py", arguments + full, [
+                f"{base}/out/modeled_balance/{path}.json"
+            ], [f"{figures}/table_balance.txt"]),
+            Stage("figure_generation", "table_turnout.py", arguments + full, [
+                f"{base}/out/modeled_turnout/{path}.json"
+            ], [f"{figures}/table_turnout.txt"]),
+            Stage("figure_generation", "graph_balance_iterator_p_values.py", arguments + full, [
+                f"{balance}/full_splits.csv"
+            ], [f"{figures}/balance_check_p_values.html"]),
+        ]
+        if configuration["full"]:
+            stages.append(Stage("figure_generation", "table_match_in.py", arguments, [
+                f"{base}/out/modeled_match_in/{path}.json"
+            ], [f"{figures}/table_match_in.txt"]))
+        else:
+            stages += [
+                Stage("figure_generation", "table_turnout_placebo.py", arguments, [
+                    f"{base}/out/modeled_turnout_placebo/{path}.json"
+                ], [f"{figures}/table_turnout_placebo.txt"]),
+                Stage("figure_generation", "table_turnout_heterogeneous.py", arguments, [
+                    f"{base}/out/modeled_turnout_heterogeneous/{path}.json"
+                ], [f"{figures}/table_turnout_heterogeneous.txt"]),
+                Stage("figure_generation", "table_turnout_heterogeneous.py", arguments + ["-xr"], [
+                    f"{base}/out/modeled_turnout_heterogeneous_race_reporting/{path}.json"
+                ], [f"{figures}/table_turnout_heterogeneous_race_reporting.txt"]),
+            ]
+        return stages
+
+    def is_current(self, stage):
+        """
+        Checks that a stage ran with the same script, utils.py, arguments and inputs, and its outputs are unchanged.
+
+        :param (Stage) stage: Stage to check.
+        :return: Boolean indicator that the stage can be skipped.
+        """
+        previous = self.state["stages"].get(stage.name)
+        if previous is None or previous["fingerprint"] != self.fingerprint(stage):
+            return False
+        return all(previous["outputs"].get(filename) == self.file_hash(filename) for filename in stage.outputs)
+
+    def fingerprint(self, stage):
+        """
+        Hashes a stage's script and utils.py sources, arguments and input file contents.
+
+        :param (Stage) stage: Stage to fingerprint.
+        :return: String SHA-256 hex digest.
+        """
+        fingerprint = {
+            "script": self.file_hash(f"{stage.directory}/{stage.script}"),
+            "utils": self.file_hash("utils.py"),
+            "arguments": stage.arguments,
+            "inputs": {filename: self.file_hash(filename) for filename in stage.inputs},
+        }
+        return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+
+    def file_hash(self, filename):
+        """
+        Hashes a file's contents, reusing the recorded hash while its size and modification time are unchanged.
+
+        :param (str) filename: Path relative to the repository root.
+        :return: String SHA-256 hex digest, or None if the file does not exist.
+        """
+        path = os.path.join(self.root, filename)
+        if not os.path.exists(path):
+            return None
+        signature = list(file_signature(path))
+        recorded = self.state["files"].get(filename)
+        if recorded is not None and recorded["signature"] == signature:
+            return recorded["sha256"]
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(chunk)
+        self.state["files"][filename] = {"signature": signature, "sha256": sha256.hexdigest()}
+        return sha256.hexdigest()
+
+    def run(self, stage):
+        """
+        Runs a stage's script in this process (so imports, voting dates and cached frames are shared).
+
+        :param (Stage) stage: Stage to run.
+        """
+        cwd, argv = os.getcwd(), sys.argv
+        os.chdir(os.path.join(self.root, stage.directory))
+        sys.argv = [stage.script] + stage.arguments
+        try:
+            runpy.run_path(stage.script, run_name="__main__")
+        finally:
+            os.chdir(cwd)
+            sys.argv = argv
+
+    def record(self, stage):
+        """
+        Records a stage's fingerprint and output hashes after it runs successfully.
+
+        :param (Stage) stage: Stage that ran.
+        """
+        for filename in stage.outputs:
+            self.state["files"].pop(filename, None)
+        self.state["stages"][stage.name] = {
+            "fingerprint": self.fingerprint(stage),
+            "outputs": {filename: self.file_hash(filename) for filename in stage.outputs},
+        }
+        os.makedirs(os.path.dirname(self.state_filename), exist_ok=True)
+        with open(self.state_filename, "w") as state_json:
+            json.dump(self.state, state_json, indent=2)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-fo", "--force",
+        action="store_true",
+        help="Run all stages, even if current (e.g. after S3 or Mongo source data change)."
+    )
+    parser.add_argument(
+        "-dr", "--dry_run",
+        action="store_true",
+        help="List stages that would run without running them."
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Number of configuration chains to run concurrently (defaults to all)."
+    )
+    parser.add_argument(
+        "-cp", "--cpus",
+        type=int,
+        default=None,
+        help="Number of CPUs available to concurrent stages (defaults to all)."
+    )
+    parser.add_argument(
+        "-m", "--memory",
+        type=float,
+        default=None,
+        help="Gigabytes of memory available to concurrent stages (defaults to physical memory)."
+    )
+    args = parser.parse_args()
+    w = Pipeline(args)
+    w.main()
@@ -1,13 +1,21 @@
 import datetime as dt
+import functools
+import glob
+import gzip
+import hashlib
+import importlib.util
+import itertools
+import json
 import logging
+import multiprocessing
 import numpy as np
 import os
 import pandas as pd
-import tqdm
+import shutil
+import threading
 
 from dotenv import load_dotenv
-from linearmodels.panel import PanelOLS
-from multiprocessing.dummy import Pool as ThreadPool
+from urllib.parse import quote
 
 load_dotenv()
 
@@ -23,33 +31,188 @@ def get_logger():
                         filename="logger.log")
     logger = logging.getLogger(__name__)
 
-    # Also, print to console.
-    console = logging.StreamHandler()
-    console.setLevel(logging.DEBUG)
-    formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
-    console.setFormatter(formatter)
-    logger.addHandler(console)
+    # Also, print to console (once per process, as stages may run in the same process).
+    if not logger.handlers:
+        console = logging.StreamHandler()
+        console.setLevel(logging.DEBUG)
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+        console.setFormatter(formatter)
+        logger.addHandler(console)
     return logger
 
 
-def thread(worker, jobs, n=15):
+@functools.lru_cache(maxsize=None)
+def get_voting_dates_by_state():
+    """
+    Reads earliest voting dates by state from S3 on first call (memoized, so scripts that never use them, like the
+    figure_generation tables, start without network access).
+
+    :return: pandas.DataFrame of state and earliest_voting_date.
+    """
+    return read_s3_csv(os.getenv("VOTING_DATES_FILE"))
+
+
+@functools.lru_cache(maxsize=None)
+def get_earliest_voting_date():
+    """
+    Finds the earliest voting date over all states (memoized).
+
+    :return: pandas.Timestamp of earliest voting date.
+    """
+    return pd.to_datetime(get_voting_dates_by_state()["earliest_voting_date"]).min()
+
+
+def general_election_day(year):
+    """
+    Finds the date of a U.S. general election (the Tuesday after the first Monday in November).
+
+    :param (int) year: Election year.
+    :return: datetime.datetime of Election Day.
+    """
+    first_monday = 1 + (7 - dt.date(year, 11, 1).weekday()) % 7
+    return dt.datetime(year, 11, first_monday + 1, 0, 0)
+
+
+def __getattr__(name):
+    """
+    Loads the S3-backed utils.voting_dates_by_state and utils.earliest_voting_date on first attribute access.
+    """
+    if name == "voting_dates_by_state":
+        return get_voting_dates_by_state()
+    if name == "earliest_voting_date":
+        return get_earliest_voting_date()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def read_s3_csv(key, **kwargs):
+    """
+    Reads a CSV file from the S3 bucket through the local cache (see cache_s3_file).
+
+    :param (str) key: Key of the file in S3_BUCKET.
+    :param kwargs: Keyword arguments passed to pandas.read_csv.
+    :return: pandas.DataFrame of file contents.
+    """
+    return pd.read_csv(cache_s3_file(key), **kwargs)
+
+
+def read_s3_csv_chunks(key, row_filter, chunksize=None, **kwargs):
+    """
+    Reads a CSV file from the S3 bucket through the local cache in chunks, keeping the rows selected from each chunk.
+
+    Only the selected rows of each chunk are held until the chunks are concatenated, so peak memory scales with the
+    output rather than the whole file.
+
+    :param (str) key: Key of the file in S3_BUCKET.
+    :param (function) row_filter: Function taking a pandas.DataFrame chunk and returning its rows to keep.
+    :param (int) chunksize: Number of rows per chunk (defaults to csv_chunk_size).
+    :param kwargs: Keyword arguments passed to pandas.read_csv (e.g., usecols and dtype).
+    :return: pandas.DataFrame of selected rows.
+    """
+    chunks = list()
+    with pd.read_csv(cache_s3_file(key), chunksize=chunksize or csv_chunk_size, **kwargs) as reader:
+        for chunk in reader:
+            chunks.append(row_filter(chunk))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def cache_s3_file(key):
+    """
+    Finds a local copy of a file in the S3 bucket, downloading it (gzip-compressed) only if missing or stale.
+
+    A cached copy is fresh while the object's ETag, size and last-modified time match those recorded at download.
+    If S3_LOCAL_DIR is set, it stands in for the bucket and files are read from it directly. If S3_OFFLINE is set,
+    cached copies are used without checking S3.
+
+    :param (str) key: Key of the file in S3_BUCKET.
+    :return: String path of local (cached) file.
+    """
+    if s3_local_dir:
+        return os.path.join(s3_local_dir, key)
+
+    # Compare cached copy with the object's metadata.
+    filename = os.path.join(s3_cache_dir, os.getenv("S3_BUCKET"), key + ".gz")
+    metadata_filename = filename + ".json"
+    cached = None
+    if os.path.exists(filename) and os.path.exists(metadata_filename):
+        with open(metadata_filename, "r") as metadata_json:
+            cached = json.load(metadata_json)
+    if s3_offline:
+        if cached is None:
+            raise FileNotFoundError(f"No cached copy of s3://{os.getenv('S3_BUCKET')}/{key} (S3_OFFLINE is set).")
+        return filename
+
+    import s3fs
+    fs = s3fs.S3FileSystem()
+    path = f"{os.getenv('S3_BUCKET')}/{key}"
+    info = fs.info(path)
+    metadata = {"etag": info.get("ETag"), "size": info.get("size"), "last_modified": str(info.get("LastModified"))}
+    if cached == metadata:
+        return filename
+
+    # Download to a temporary file first, as concurrent processes may fetch the same file.
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temporary = f"{filename}.{os.getpid()}.{threading.get_ident()}"
+    with fs.open(path, "rb") as source, gzip.open(temporary, "wb", compresslevel=s3_cache_compression) as target:
+        shutil.copyfileobj(source, target, length=16 * 1024 ** 2)
+    os.replace(temporary, filename)
+    with open(metadata_filename, "w") as metadata_json:
+        json.dump(metadata, metadata_json)
+    return filename
+
+
+def thread(worker, jobs, n=None, backend="threads"):
     """
     Generic method to parallelize a function over a list of inputs.
 
+    The "processes" backend hands worker to the pool once (inherited through fork where available, otherwise sent
+    once per process), so bound methods and the pandas.DataFrame attributes of their instances are not pickled per job.
+
     :param (func) worker: Method to run on each element of jobs.
     :param (list) jobs: List of objects on which to run worker.
-    :param (int) n: Number of threads to parallelize.
-    :return: List of results of pool process.
+    :param (int) n: Number of threads or processes to parallelize (defaults to 15 threads or one process per CPU).
+    :param (str) backend: Executor to use, one of "threads", "processes" or "serial".
+    :return: List of results of pool process, in order of completion.
     """
-    pool = ThreadPool(n)
+    import tqdm
+    from multiprocessing.dummy import Pool as ThreadPool
+
+    if backend not in parallel_backends:
+        raise ValueError(f"Unknown backend {backend} (choose from {parallel_backends}).")
+    if backend == "serial":
+        return [worker(job) for job in tqdm.tqdm(jobs, total=len(jobs))]
+
+    if backend == "threads":
+        pool = ThreadPool(n or 15)
+    elif "fork" in multiprocessing.get_all_start_methods():
+        _set_pool_worker(worker)
+        pool = multiprocessing.get_context("fork").Pool(n or os.cpu_count())
+        worker = _run_pool_worker
+    else:
+        pool = multiprocessing.get_context("spawn").Pool(
+            n or os.cpu_count(), initializer=_set_pool_worker, initargs=(worker,)
+        )
+        worker = _run_pool_worker
     results = []
-    for result in tqdm.tqdm(pool.imap_unordered(worker, jobs), total=len(jobs)):
-        results.append(result)
-    pool.close()
-    pool.join()
+    try:
+        for result in tqdm.tqdm(pool.imap_unordered(worker, jobs), total=len(jobs)):
+            results.append(result)
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+        _set_pool_worker(None)
     return results
 
 
+def _set_pool_worker(worker):
+    global _pool_worker
+    _pool_worker = worker
+
+
+def _run_pool_worker(job):
+    return _pool_worker(job)
+
+
 def create_combo_path(arguments):
     """
     Takes input arguments and stitches together a path from common parameters.
@@ -74,7 +237,10 @@ def make_column_dummies(df, column):
     :param column: Column of pandas.DataFrame from whose values to create dummy columns.
     :return: Output pandas.DataFrame with new dummy columns.
     """
-    dummies = pd.get_dummies(df[column], prefix=column)
+    values = df[column]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.cat.remove_unused_categories()
+    dummies = pd.get_dummies(values, prefix=column)
     dummies.loc[(dummies == 0).all(axis=1)] = None
     return pd.concat([df, dummies], axis=1)
 
@@ -107,6 +273,78 @@ def simplify_l2_race(df):
     return df
 
 
+def zero_charge_jails(df):
+    """
+    Finds jails whose records report only 0 jdi_num_charges.
+
+    :param (pandas.DataFrame) df: pandas.DataFrame of matched records.
+    :return: numpy.ndarray of jail_id values.
+    """
+    num_charges = df.groupby("jail_id", observed=True)["jdi_num_charges"].unique().reset_index()
+    num_charges["num_charges"] = num_charges["jdi_num_charges"].apply(lambda l: sum(l))
+    return num_charges[num_charges["num_charges"] == 0]["jail_id"].unique()
+
+
+def missing_charge_type_jails(df):
+    """
+    Finds jails whose records report no jdi_charge_types.
+
+    :param (pandas.DataFrame) df: pandas.DataFrame of matched records.
+    :return: numpy.ndarray of jail_id values.
+    """
+    charge_types = df.groupby("jail_id", observed=True)["jdi_charge_types"].unique().reset_index()
+    charge_types["missing"] = charge_types["jdi_charge_types"].apply(lambda l: pd.isna(l).all()).astype(bool)
+    return charge_types[charge_types["missing"]]["jail_id"].unique()
+
+
+def missing_bond_jails(df):
+    """
+    Finds jails whose records report no jdi_bond amounts.
+
+    :param (pandas.DataFrame) df: pandas.DataFrame of matched records.
+    :return: numpy.ndarray of jail_id values.
+    """
+    total_bond = df.groupby("jail_id", observed=True)["jdi_bond"].sum().reset_index()
+    return total_bond[total_bond["jdi_bond"] == 0]["jail_id"].unique()
+
+
+def prepped_view(df, column, threshold, active=False, registered=False, no_charge=False, no_bond=False):
+    """
+    Filters the prepped superset of matched records (see matched_bookings/prep_data.py) to one configuration.
+
+    Active and registered flags hold per record, but whether a jail reports charges or bond amounts depends on which
+    of its records remain, so jails are checked on the configuration's records, as prepping it separately would.
+
+    :param (pandas.DataFrame) df: pandas.DataFrame of the prepped superset with flag columns.
+    :param (str) column: Match probability column on which to threshold records.
+    :param (float) threshold: Threshold above which to consider matched records as matches.
+    :param (bool) active: Indicator to only consider voters demarcated as Active by L2.
+    :param (bool) registered: Indicator to only consider voters registered by Election Day.
+    :param (bool) no_charge: Indicator to only consider voters from jails that report charges.
+    :param (bool) no_bond: Indicator to only consider voters from jails that report bond amounts.
+    :return: pandas.DataFrame of the configuration's records, without flag columns or dummies of absent values.
+    """
+    if threshold < prepped_superset_threshold:
+        raise ValueError(f"Threshold {threshold} is below that of the prepped superset ({prepped_superset_threshold}).")
+    view = df[df[column] > threshold]
+    if active:
+        view = view[view["flag_active"]]
+    if registered:
+        view = view[view["flag_registered"]]
+
+    # Subset to voters from jails that report charges (and bond amounts).
+    if no_charge:
+        view = view[~view["jail_id"].isin(zero_charge_jails(view))]
+        view = view[~view["jail_id"].isin(missing_charge_type_jails(view))]
+    if no_bond:
+        view = view[~view["jail_id"].isin(missing_bond_jails(view))]
+
+    # Drop dummies of values no remaining record takes (make_column_dummies only creates those present).
+    dummy_prefixes = tuple(f"{c}_" for c in dummy_columns)
+    absent = [c for c in view.columns if c.startswith(dummy_prefixes) and not view[c].any()]
+    return view.drop(columns=prepped_flag_columns + absent)
+
+
 def signify(coefficient, p_value):
     """
     Takes in a coefficient and asterisks based on associated p-values.
@@ -148,6 +386,105 @@ def set_to_datetime(df):
     return df
 
 
+def set_dtypes(df):
+    """
+    Takes pandas.DataFrame of booking records and assigns compact dtypes to known columns (see column_dtypes).
+
+    Date columns are set to datetime, string values to categoricals, indicators to nullable Int8, dummies (from
+    make_column_dummies) to nullable booleans and day counts to Int16. Ages, bonds and charge counts stay float64, so
+    prepped data written after set_dtypes keeps their values exactly. The memory footprint before and after is logged.
+
+    :param (pandas.DataFrame) df: pandas.DataFrame of booking records.
+    :return: pandas.DataFrame with compact column dtypes.
+    """
+    before = df.memory_usage(deep=True).sum()
+    df = set_to_datetime(df)
+    dummy_prefixes = tuple(f"{column}_" for column in dummy_columns + ["jdi_gender", "jdi_race"])
+    dtypes = dict()
+    for column in df.columns:
+        if column in column_dtypes:
+            dtypes[column] = column_dtypes[column]
+        elif column.startswith("l2_voted_indicator_"):
+            dtypes[column] = "Int8"
+        elif column.startswith(dummy_prefixes):
+            dtypes[column] = "boolean"
+    df = df.astype(dtypes)
+    after = df.memory_usage(deep=True).sum()
+    get_logger().info(f"Memory footprint: {before / 1024 ** 2:.1f} MB to {after / 1024 ** 2:.1f} MB.")
+    return df
+
+
+def set_votable_days(df, validate=False):
+    """
+    Takes pandas.DataFrame and computes votable days and votable days in custody in closed form.
+
+    Votable days run from the state's earliest voting date through Election Day, and votable days in custody are
+    the overlap of that range with [jdi_date_admission, jdi_date_release]. Both are counted with NumPy arithmetic on
+    datetime64 arrays, matching the day-by-day pandas.date_range intersection of votable_days_row_wise exactly.
+
+    :param (pandas.DataFrame) df: pandas.DataFrame of booking records with date columns set to datetime.
+    :param (bool) validate: Indicator to check results against the row-wise method (slow).
+    :return: pandas.DataFrame with votable_days_in_custody, votable_days and pct_votable_days_in_custody columns.
+    """
+    day = np.timedelta64(1, "D").astype("timedelta64[ns]").astype(np.int64)
+    election = np.datetime64(election_day, "ns").astype(np.int64)
+    voting = df["earliest_voting_date"].to_numpy(dtype="datetime64[ns]")
+    admission = df["jdi_date_admission"].to_numpy(dtype="datetime64[ns]")
+    release = df["jdi_date_release"].to_numpy(dtype="datetime64[ns]")
+    missing_voting = np.isnat(voting)
+    missing = missing_voting | np.isnat(admission) | np.isnat(release)
+    voting, admission, release = voting.astype(np.int64), admission.astype(np.int64), release.astype(np.int64)
+
+    # Daily ranges only share dates if they start at the same time of day.
+    start = np.maximum(voting, admission)
+    end = np.minimum(release, election)
+    aligned = (admission - voting) % day == 0
+    in_custody = np.where(aligned & (end >= start), (end - start) // day + 1, 0)
+    votable = np.where(election >= voting, (election - voting) // day + 1, 0)
+
+    # Keep integer counts unless dates are missing.
+    if missing.any():
+        in_custody = np.where(missing, np.nan, in_custody)
+    if missing_voting.any():
+        votable = np.where(missing_voting, np.nan, votable)
+    df["votable_days_in_custody"] = in_custody
+    df["votable_days"] = votable
+    df["pct_votable_days_in_custody"] = df["votable_days_in_custody"] / df["votable_days"]
+
+    if validate and (~missing).any():
+        check = df[~missing]
+        in_custody_row_wise, votable_row_wise = votable_days_row_wise(check)
+        mismatches = (
+            (check["votable_days_in_custody"] != in_custody_row_wise) |
+            (check["votable_days"] != votable_row_wise)
+        ).sum()
+        if mismatches:
+            raise ValueError(f"Votable days differ from row-wise method for {mismatches} records.")
+    return df
+
+
+def votable_days_row_wise(df):
+    """
+    Takes pandas.DataFrame and counts votable days (in custody) by intersecting daily date ranges row by row.
+
+    :param (pandas.DataFrame) df: pandas.DataFrame of booking records with date columns set to datetime.
+    :return: Tuple of pandas.Series of votable days in custody and votable days.
+    """
+    votable_days_in_custody = df.apply(
+        lambda x: len(set(list(
+            pd.date_range(x["earliest_voting_date"], election_day)
+        )).intersection(set(list(
+            pd.date_range(x["jdi_date_admission"], x["jdi_date_release"])
+        )))), axis=1
+    )
+    votable_days = df.apply(
+        lambda x: len(set(list(
+            pd.date_range(x["earliest_voting_date"], election_day)
+        ))), axis=1
+    )
+    return votable_days_in_custody, votable_days
+
+
 def treatment_control_split(base_df, control, treatment_rollback, no_charge, no_bond):
     """
     Takes in a pandas.DataFrame and splits it into Treatment/Control based on input arguments.
@@ -161,7 +498,7 @@ def treatment_control_split(base_df, control, treatment_rollback, no_charge, no_
     """
     # Subset to admissions in range [first voting + treatment_rollback, Election Day + control].
     df = base_df.copy()
-    df = df[df["jdi_date_admission"] >= earliest_voting_date + dt.timedelta(days=treatment_rollback)]
+    df = df[df["jdi_date_admission"] >= get_earliest_voting_date() + dt.timedelta(days=treatment_rollback)]
     df = df[df["jdi_date_admission"] <= election_day + dt.timedelta(days=control)]
 
     # Assign Treatment (T) vs. Control (C).
@@ -196,17 +533,64 @@ def treatment_control_split(base_df, control, treatment_rollback, no_charge, no_
     return to_model
 
 
-def model(to_model, dependent, independent, entity_fx, time_fx):
+def model(to_model, dependent, independent, entity_fx, time_fx, engine=None, cache_dir=None):
     """
     Takes in a pandas.DataFrame and runs it through PanelOLS based on input arguments.
 
-    :param to_model: pandas.DataFrame of booking records.
-    :param dependent: Dependent variable (outcome) in model.
+    :param to_model: pandas.DataFrame of booking records (or PreparedPanel of them shared by several designs).
+    :param dependent: Dependent variable (outcome) in model, or list of outcomes fit on their shared sample.
     :param independent: Independent variables (features) in model.
     :param entity_fx: Indicator to include fixed entity effects.
     :param time_fx: Indicator to include fixed time effects.
-    :return: PanelOLS.fit class with modeling results.
+    :param engine: Estimation engine, "linearmodels" or "numpy" (defaults to the MODEL_ENGINE setting).
+    :param cache_dir: Directory of cached fits (defaults to the MODEL_CACHE_DIR setting; False disables caching).
+    :return: PanelOLS.fit class (or FitSummary for the numpy engine or a cached fit) with modeling results (list
+    of them, one per outcome, for a list of dependents).
     """
+    engine = engine or model_engine
+    if engine not in model_engines:
+        raise ValueError(f"Unknown model engine {engine} (choose from {model_engines}).")
+    cache_dir = model_cache_dir if cache_dir is None else cache_dir
+
+    # Fit several outcomes of one design on the records complete for all of them (one factorization with numpy).
+    if not isinstance(dependent, str):
+        if engine == "numpy" and not cache_dir:
+            if not isinstance(to_model, PreparedPanel):
+                to_model = PreparedPanel(to_model, list(dependent) + list(independent))
+            return to_model.fit(dependent, independent, entity_fx, time_fx)
+        if isinstance(to_model, PreparedPanel):
+            to_model = to_model.df
+        to_model = to_model[to_model[list(dependent) + list(independent)].notna().all(axis=1)]
+        return [
+            model(to_model, outcome, independent, entity_fx, time_fx, engine=engine, cache_dir=cache_dir)
+            for outcome in dependent
+        ]
+
+    # Designs of a prepared panel share its demeaned columns (numpy engine) and otherwise fit its records.
+    panel = None
+    if isinstance(to_model, PreparedPanel):
+        if engine == "numpy" and not cache_dir:
+            return to_model.fit(dependent, independent, entity_fx, time_fx)
+        panel, to_model = to_model, to_model.df
+
+    # Model the numeric values of compact (e.g. nullable Int8 and boolean) columns.
+    to_model = to_model[[dependent] + list(independent)].astype(np.float64)
+
+    # Look up fits of the same data, formula and co-variance options.
+    if cache_dir:
+        key = fit_cache_key(to_model, dependent, independent, entity_fx, time_fx, engine)
+        fit = read_cached_fit(cache_dir, key)
+        if fit is None:
+            fit = model(
+                to_model if panel is None else panel, dependent, independent, entity_fx, time_fx,
+                engine=engine, cache_dir=False,
+            )
+            write_cached_fit(cache_dir, key, fit)
+        return fit
+
+    if engine == "numpy":
+        return within_ols(to_model, dependent, independent, entity_fx, time_fx)
+
     # Specify model formula as string.
     formula = f"{dependent} ~ "
     if independent:
@@ -217,11 +601,701 @@ def model(to_model, dependent, independent, entity_fx, time_fx):
         formula += " + TimeEffects"
 
     # Model and fit with clustered co-variance, optional entity and time effects.
+    from linearmodels.panel import PanelOLS
     panel_model = PanelOLS.from_formula(formula=formula, data=to_model)
     panel_fit = panel_model.fit(cov_type="clustered", cluster_entity=entity_fx, cluster_time=time_fx)
     return panel_fit
 
 
+def within_ols(to_model, dependent, independent, entity_fx, time_fx):
+    """
+    Fits the PanelOLS specification of utils.model with NumPy: absorbs entity (and time) effects with group sums,
+    solves by QR and computes entity (and time) clustered co-variance and the joint F-statistic as PanelOLS does
+    (debiased, effects counted only when not nested within a single clustering dimension).
+
+    :param to_model: pandas.DataFrame of booking records indexed by entity and time.
+    :param dependent: Dependent variable (outcome) in model.
+    :param independent: Independent variables (features) in model.
+    :param entity_fx: Indicator to include fixed entity effects.
+    :param time_fx: Indicator to include fixed time effects.
+    :return: FitSummary with modeling results.
+    """
+    # Drop records missing any modeled value, as PanelOLS does.
+    values = to_model[[dependent] + list(independent)].to_numpy(dtype=np.float64, na_value=np.nan)
+    complete = ~np.isnan(values).any(axis=1)
+    values = values[complete]
+    entity = pd.factorize(to_model.index.get_level_values(0)[complete])[0]
+    time = pd.factorize(to_model.index.get_level_values(1)[complete])[0]
+
+    values = within_transform(values, entity, time, entity_fx, time_fx)
+    return solve_within(values[:, 0], values[:, 1:], list(independent), entity, time, entity_fx, time_fx)
+
+
+def within_transform(values, entity, time, entity_fx, time_fx):
+    """
+    Removes entity and/or time means from columns of values.
+
+    With both effects, the dimension with more groups is demeaned directly and the other is partialled out exactly
+    through its (demeaned) dummies, using only group sums and a small dense system.
+
+    :param (numpy.ndarray) values: Two-dimensional array of observations by variables.
+    :param (numpy.ndarray) entity: Integer entity codes (0 to number of entities - 1).
+    :param (numpy.ndarray) time: Integer time codes (0 to number of periods - 1).
+    :param (bool) entity_fx: Indicator to absorb entity effects.
+    :param (bool) time_fx: Indicator to absorb time effects.
+    :return: numpy.ndarray of demeaned values.
+    """
+    if not (entity_fx or time_fx):
+        return values
+    if not (entity_fx and time_fx):
+        return group_demean(values, entity if entity_fx else time)
+
+    # Demean the larger dimension (a), then project out the demeaned dummies of the smaller (b).
+    a, b = (entity, time) if entity.max() >= time.max() else (time, entity)
+    n_a, n_b = a.max() + 1, b.max() + 1
+    demeaned = group_demean(values, a)
+    counts = np.bincount(a * n_b + b, minlength=n_a * n_b).reshape(n_a, n_b).astype(np.float64)
+    size_a = counts.sum(axis=1)
+    dummies_cross = np.diag(counts.sum(axis=0)) - counts.T @ (counts / size_a[:, None])
+    effects = np.linalg.pinv(dummies_cross) @ group_sums(demeaned, b, n_b)
+    return demeaned - effects[b] + ((counts @ effects) / size_a[:, None])[a]
+
+
+def group_sums(values, codes, n_groups):
+    """
+    Sums columns of values within groups.
+
+    :param (numpy.ndarray) values: Two-dimensional array of observations by variables.
+    :param (numpy.ndarray) codes: Integer group codes.
+    :param (int) n_groups: Number of groups.
+    :return: numpy.ndarray of groups by variables.
+    """
+    return np.column_stack([
+        np.bincount(codes, weights=values[:, j], minlength=n_groups) for j in range(values.shape[1])
+    ]).reshape(n_groups, values.shape[1])
+
+
+def group_cross_products(values, codes, n_groups):
+    """
+    Sums outer products of rows of values within groups.
+
+    :param (numpy.ndarray) values: Two-dimensional array of observations by variables.
+    :param (numpy.ndarray) codes: Integer group codes.
+    :param (int) n_groups: Number of groups.
+    :return: numpy.ndarray of groups by variables by variables.
+    """
+    k = values.shape[1]
+    cross = np.empty((n_groups, k, k))
+    for i in range(k):
+        for j in range(i, k):
+            cross[:, i, j] = cross[:, j, i] = np.bincount(
+                codes, weights=values[:, i] * values[:, j], minlength=n_groups
+            )
+    return cross
+
+
+def group_demean(values, codes):
+    """
+    Subtracts group means from columns of values.
+
+    :param (numpy.ndarray) values: Two-dimensional array of observations by variables.
+    :param (numpy.ndarray) codes: Integer group codes.
+    :return: numpy.ndarray of demeaned values.
+    """
+    n_groups = codes.max() + 1
+    means = group_sums(values, codes, n_groups) / np.bincount(codes, minlength=n_groups)[:, None]
+    return values - means[codes]
+
+
+def solve_within(y, x, names, entity, time, entity_fx, time_fx, r=None):
+    """
+    Solves demeaned OLS by QR and computes clustered co-variance, p-values and the joint F-statistic.
+
+    :param (numpy.ndarray) y: Demeaned dependent variable.
+    :param (numpy.ndarray) x: Demeaned independent variables.
+    :param (list) names: Independent variable names.
+    :param (numpy.ndarray) entity: Integer entity codes.
+    :param (numpy.ndarray) time: Integer time codes.
+    :param (bool) entity_fx: Indicator that entity effects were absorbed (and entity clusters used).
+    :param (bool) time_fx: Indicator that time effects were absorbed (and time clusters used).
+    :param (numpy.ndarray) r: Triangular QR factor of [x, y] (computed if None).
+    :return: FitSummary with modeling results.
+    """
+    from scipy import stats
+
+    # Triangular factor of [x, y] gives the estimates without forming Q.
+    nobs, k = x.shape
+    if r is None:
+        r = np.linalg.qr(np.column_stack([x, y]), mode="r")
+    r = r[:k]
+    if np.linalg.matrix_rank(r[:, :k]) < k:
+        raise ValueError(f"Independent variables are collinear or absorbed by fixed effects: {names}.")
+    params = np.linalg.solve(r[:, :k], r[:, k])
+    eps = y - x @ params
+    r_inv = np.linalg.inv(r[:, :k])
+    xpxi = r_inv @ r_inv.T
+
+    # Degrees of freedom consumed by effects (counted unless nested in a single clustering dimension).
+    n_entity, n_time = entity.max() + 1, time.max() + 1
+    effects = n_entity * entity_fx + n_time * time_fx - int(entity_fx and time_fx)
+    df_resid = nobs - k - effects
+    extra_df = effects if entity_fx and time_fx else 0
+
+    # Clustered "meat" (two-way clusters add one-way terms and remove their intersection).
+    scores = x * eps[:, None]
+    if entity_fx and time_fx:
+        # Sum scores once per entity-time cell and the cell totals per entity and per time.
+        both, cells = pd.factorize(entity * n_time + time)
+        totals = group_sums(scores, both, len(cells))
+        meat = (
+            cluster_meat(totals, cells // n_time) + cluster_meat(totals, cells % n_time) - totals.T @ totals
+        )
+    elif entity_fx or time_fx:
+        meat = cluster_meat(scores, entity if entity_fx else time)
+    else:
+        meat = scores.T @ scores
+    cov = xpxi @ meat @ xpxi * nobs / (nobs - extra_df - k)
+    cov = (cov + cov.T) / 2
+
+    std_errors = np.sqrt(np.diag(cov))
+    pvalues = 2 * stats.t.sf(np.abs(params / std_errors), df_resid)
+
+    # Homoskedastic joint F-test of all regressors.
+    resid_ss = float(eps @ eps)
+    stat = ((float(y @ y) - resid_ss) / k) / (resid_ss / df_resid) if resid_ss > 0 else 0.0
+    f_statistic = FTest(stat, float(stats.f.sf(stat, k, df_resid)), k, df_resid)
+
+    return FitSummary(
+        params=pd.Series(params, index=names, name="parameter"),
+        std_errors=pd.Series(std_errors, index=names, name="std_error"),
+        pvalues=pd.Series(pvalues, index=names, name="pvalue"),
+        nobs=nobs,
+        f_statistic=f_statistic,
+    )
+
+
+def cluster_meat(scores, codes):
+    """
+    Sums outer products of within-cluster score totals.
+
+    :param (numpy.ndarray) scores: Observations by variables array of x * residual.
+    :param (numpy.ndarray) codes: Integer cluster codes.
+    :return: numpy.ndarray of variables by variables.
+    """
+    totals = group_sums(scores, codes, codes.max() + 1)
+    return totals.T @ totals
+
+
+def compare_model_engines(to_model, dependent, independent, entity_fx, time_fx, rtol=1e-6):
+    """
+    Fits a model with both engines and raises if estimates differ beyond tolerance.
+
+    :param to_model: pandas.DataFrame of booking records.
+    :param dependent: Dependent variable (outcome) in model.
+    :param independent: Independent variables (features) in model.
+    :param entity_fx: Indicator to include fixed entity effects.
+    :param time_fx: Indicator to include fixed time effects.
+    :param rtol: Relative tolerance for estimates (p-values compared with absolute tolerance rtol).
+    :return: Tuple of the linearmodels and numpy fits.
+    """
+    reference = model(to_model, dependent, independent, entity_fx, time_fx, engine="linearmodels", cache_dir=False)
+    fit = model(to_model, dependent, independent, entity_fx, time_fx, engine="numpy", cache_dir=False)
+    checks = {
+        "params": np.allclose(fit.params, reference.params[fit.params.index], rtol=rtol, atol=0),
+        "std_errors": np.allclose(fit.std_errors, reference.std_errors[fit.params.index], rtol=rtol, atol=0),
+        "pvalues": np.allclose(fit.pvalues, reference.pvalues[fit.params.index], rtol=0, atol=rtol),
+        "nobs": fit.nobs == reference.nobs,
+        "f_statistic": np.isclose(fit.f_statistic.stat, reference.f_statistic.stat, rtol=rtol, atol=0),
+        "f_p_value": np.isclose(fit.f_statistic.pval, reference.f_statistic.pval, rtol=0, atol=rtol),
+    }
+    failed = [key for key, passed in checks.items() if not passed]
+    if failed:
+        raise ValueError(f"Model engines disagree on {failed} for {dependent} ~ {independent}.")
+    return reference, fit
+
+
+class FTest:
+    """
+    Joint F-test statistic, p-value and degrees of freedom (as in linearmodels' WaldTestStatistic).
+    """
+
+    def __init__(self, stat, pval, df, df_denom):
+        self.stat = stat
+        self.pval = pval
+        self.df = df
+        self.df_denom = df_denom
+
+
+class FitSummary:
+    """
+    Compact fixed effects OLS results exposing the PanelOLS.fit attributes used downstream.
+    """
+
+    def __init__(self, params, std_errors, pvalues, nobs, f_statistic):
+        self.params = params
+        self.std_errors = std_errors
+        self.pvalues = pvalues
+        self.nobs = nobs
+        self.f_statistic = f_statistic
+
+
+class PreparedPanel:
+    """
+    Booking records indexed by entity and time whose columns are demeaned (and factored by QR) once per sample and
+    effects, so designs fit on them by utils.model (numpy engine) only solve the residual regression
+    (Frisch-Waugh-Lovell) from a small factor of their columns. With the linearmodels engine, utils.model fits its
+    records (each design absorbing effects again).
+    """
+
+    def __init__(self, to_model, columns):
+        """
+        :param to_model: pandas.DataFrame of booking records indexed by entity and time.
+        :param (list) columns: Union of dependent and independent variables of the designs to fit.
+        """
+        self.df = to_model
+        self.columns = list(dict.fromkeys(columns))
+        self.demeaned = dict()
+
+    @functools.cached_property
+    def values(self):
+        """
+        Modeled columns as float64 (converted on first fit, so panels fit by linearmodels never copy them).
+        """
+        return self.df[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    @functools.cached_property
+    def missing(self):
+        """
+        Boolean array of missing modeled values.
+        """
+        return np.isnan(self.values)
+
+    def fit(self, dependent, independent, entity_fx, time_fx):
+        """
+        Fits one design as utils.within_ols would from the demeaned columns of its sample.
+
+        :param dependent: Dependent variable (outcome) in model, or list of outcomes fit on their shared sample.
+        :param independent: Independent variables (features) in model.
+        :param entity_fx: Indicator to include fixed entity effects.
+        :param time_fx: Indicator to include fixed time effects.
+        :return: FitSummary with modeling results (list of them, one per outcome, for a list of dependents).
+        """
+        outcomes = [dependent] if isinstance(dependent, str) else list(dependent)
+        positions = [self.columns.index(column) for column in list(independent) + outcomes]
+        complete = ~self.missing[:, positions].any(axis=1)
+        values, r, entity, time, demeaned_columns = self.demean(complete, entity_fx, time_fx)
+        positions = [demeaned_columns.index(p) for p in positions]
+        x_positions = positions[:len(positions) - len(outcomes)]
+        x = values[:, x_positions]
+
+        # Columns of the full factor are the design's columns rotated by Q, so their factor is the design's.
+        fits = list()
+        for y_position in positions[len(x_positions):]:
+            fits.append(solve_within(
+                values[:, y_position], x, list(independent), entity, time, entity_fx, time_fx,
+                r=np.linalg.qr(r[:, x_positions + [y_position]], mode="r"),
+            ))
+        return fits[0] if isinstance(dependent, str) else fits
+
+    def demean(self, complete, entity_fx, time_fx):
+        """
+        Demeans and factors every column complete on a sample once per sample and effects.
+
+        :param (numpy.ndarray) complete: Boolean array of records in the sample.
+        :param (bool) entity_fx: Indicator to absorb entity effects.
+        :param (bool) time_fx: Indicator to absorb time effects.
+        :return: Tuple of demeaned values, their triangular QR factor, entity codes, time codes and the positions
+        of the demeaned columns.
+        """
+        key = (np.packbits(complete).tobytes(), entity_fx, time_fx)
+        if key not in self.demeaned:
+            demeaned_columns = list(np.flatnonzero(~self.missing[complete].any(axis=0)))
+            entity = pd.factorize(self.df.index.get_level_values(0)[complete])[0]
+            time = pd.factorize(self.df.index.get_level_values(1)[complete])[0]
+            values = within_transform(
+                self.values[np.ix_(complete, demeaned_columns)], entity, time, entity_fx, time_fx
+            )
+            r = np.linalg.qr(values, mode="r")
+            self.demeaned[key] = (values, r, entity, time, demeaned_columns)
+        return self.demeaned[key]
+
+
+def fit_cache_key(to_model, dependent, independent, entity_fx, time_fx, engine):
+    """
+    Hashes the modeled columns and index of a pandas.DataFrame with the formula, co-variance options and engine.
+
+    :param to_model: pandas.DataFrame of booking records indexed by entity and time.
+    :param dependent: Dependent variable (outcome) in model.
+    :param independent: Independent variables (features) in model.
+    :param entity_fx: Indicator to include fixed entity effects.
+    :param time_fx: Indicator to include fixed time effects.
+    :param engine: Estimation engine.
+    :return: String SHA-256 hex digest.
+    """
+    columns = [dependent] + list(independent)
+    specification = {
+        "columns": columns,
+        "index": list(to_model.index.names),
+        "entity_fx": entity_fx,
+        "time_fx": time_fx,
+        "cov_type": "clustered",
+        "cluster_entity": entity_fx,
+        "cluster_time": time_fx,
+        "engine": engine,
+    }
+    key = hashlib.sha256(json.dumps(specification, sort_keys=True).encode())
+    key.update(pd.util.hash_pandas_object(to_model[columns], index=True).to_numpy().tobytes())
+    return key.hexdigest()
+
+
+def summarize_fit(fit):
+    """
+    Takes a fit and keeps the statistics used downstream as a JSON-serializable dict (see fit_from_summary).
+
+    :param fit: PanelOLS.fit class or FitSummary.
+    :return: Dict of params, std_errors, pvalues, nobs and f_statistic.
+    """
+    return {
+        "params": [[name, float(value)] for name, value in fit.params.items()],
+        "std_errors": [[name, float(value)] for name, value in fit.std_errors.items()],
+        "pvalues": [[name, float(value)] for name, value in fit.pvalues.items()],
+        "nobs": int(fit.nobs),
+        "f_statistic": {
+            "stat": float(fit.f_statistic.stat),
+            "pval": float(fit.f_statistic.pval),
+            "df": int(fit.f_statistic.df),
+            "df_denom": int(fit.f_statistic.df_denom),
+        },
+    }
+
+
+def fit_from_summary(summary):
+    """
+    Rebuilds a fit from the dict written by summarize_fit.
+
+    :param (dict) summary: Dict of params, std_errors, pvalues, nobs and f_statistic.
+    :return: FitSummary with modeling results.
+    """
+    return FitSummary(
+        params=pd.Series(dict(summary["params"]), name="parameter"),
+        std_errors=pd.Series(dict(summary["std_errors"]), name="std_error"),
+        pvalues=pd.Series(dict(summary["pvalues"]), name="pvalue"),
+        nobs=summary["nobs"],
+        f_statistic=FTest(**summary["f_statistic"]),
+    )
+
+
+def read_cached_fit(cache_dir, key):
+    """
+    Reads a cached fit summary and marks it as recently used.
+
+    :param cache_dir: Directory of cached fits.
+    :param key: Cache key from fit_cache_key.
+    :return: FitSummary, or None if not cached.
+    """
+    filename = os.path.join(cache_dir, f"{key}.json")
+    try:
+        with open(filename, "r") as cached_json:
+            cached = json.load(cached_json)
+        os.utime(filename)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return fit_from_summary(cached)
+
+
+def write_cached_fit(cache_dir, key, fit):
+    """
+    Writes a compact fit summary to the cache and evicts least recently used fits beyond model_cache_size.
+
+    :param cache_dir: Directory of cached fits.
+    :param key: Cache key from fit_cache_key.
+    :param fit: PanelOLS.fit class or FitSummary.
+    """
+    cached = summarize_fit(fit)
+
+    # Write to a temporary file first, as concurrent workers may write the same fit.
+    os.makedirs(cache_dir, exist_ok=True)
+    filename = os.path.join(cache_dir, f"{key}.json")
+    temporary = f"{filename}.{os.getpid()}.{threading.get_ident()}"
+    with open(temporary, "w") as cached_json:
+        json.dump(cached, cached_json)
+    os.replace(temporary, filename)
+    evict_cached_fits(cache_dir, model_cache_size)
+
+
+def evict_cached_fits(cache_dir, max_bytes):
+    """
+    Deletes least recently used cached fits until the cache is within max_bytes.
+
+    :param cache_dir: Directory of cached fits.
+    :param max_bytes: Maximum total size of cached fits in bytes.
+    """
+    entries = list()
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".json"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def bookings_cache_filename(cache_dir, roster):
+    """
+    Builds the filename of the cached JDI bookings of one roster.
+
+    :param (str) cache_dir: Directory of cached bookings.
+    :param (str) roster: Roster (jail_id) in format "{state}-{county}".
+    :return: String filename of cached bookings Parquet file (covered intervals are kept alongside as JSON).
+    """
+    return os.path.join(cache_dir, quote(roster, safe="") + ".parquet")
+
+
+def read_cached_bookings(cache_dir, roster):
+    """
+    Reads the cached JDI bookings of one roster and the meta.first_seen intervals they cover.
+
+    :param (str) cache_dir: Directory of cached bookings.
+    :param (str) roster: Roster (jail_id) in format "{state}-{county}".
+    :return: Tuple of pandas.DataFrame of bookings (None if not cached) and list of (start, end) datetime tuples.
+    """
+    intervals = read_cached_intervals(cache_dir, roster)
+    if not intervals:
+        return None, intervals
+    try:
+        return pd.read_parquet(bookings_cache_filename(cache_dir, roster)), intervals
+    except FileNotFoundError:
+        return None, list()
+
+
+def read_cached_intervals(cache_dir, roster):
+    """
+    Reads the meta.first_seen intervals covered by the cached JDI bookings of one roster.
+
+    :param (str) cache_dir: Directory of cached bookings.
+    :param (str) roster: Roster (jail_id) in format "{state}-{county}".
+    :return: List of (start, end) datetime tuples (empty if not cached, including when only intervals remain).
+    """
+    if not os.path.exists(bookings_cache_filename(cache_dir, roster)):
+        return list()
+    try:
+        with open(bookings_cache_filename(cache_dir, roster) + ".json", "r") as intervals_json:
+            cached = json.load(intervals_json)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return list()
+    if not isinstance(cached, dict) or cached.get("version") != bookings_cache_version:
+        return list()
+    return [tuple(dt.datetime.fromisoformat(d) for d in i) for i in cached["intervals"]]
+
+
+def write_cached_bookings(cache_dir, roster, bookings, intervals):
+    """
+    Writes the JDI bookings of one roster to the cache with the meta.first_seen intervals they cover.
+
+    :param (str) cache_dir: Directory of cached bookings.
+    :param (str) roster: Roster (jail_id) in format "{state}-{county}".
+    :param (pandas.DataFrame) bookings: pandas.DataFrame of all cached bookings of the roster.
+    :param (list) intervals: List of (start, end) datetime tuples covered by bookings (merged before writing).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    filename = bookings_cache_filename(cache_dir, roster)
+    temporary = f"{filename}.{os.getpid()}.{threading.get_ident()}"
+    bookings.to_parquet(temporary, index=False, compression=split_compression)
+    os.replace(temporary, filename)
+    with open(temporary, "w") as intervals_json:
+        json.dump({
+            "version": bookings_cache_version,
+            "intervals": [[d.isoformat() for d in i] for i in merge_intervals(intervals)],
+        }, intervals_json)
+    os.replace(temporary, filename + ".json")
+
+
+def invalidate_cached_bookings(cache_dir, rosters=None):
+    """
+    Deletes cached JDI bookings so they are collected again.
+
+    :param (str) cache_dir: Directory of cached bookings.
+    :param (list) rosters: Rosters (jail_id) to invalidate, or None to invalidate all.
+    :return: Integer number of rosters invalidated.
+    """
+    if not os.path.exists(cache_dir):
+        return 0
+    if rosters is None:
+        filenames = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith(".parquet")]
+    else:
+        filenames = [bookings_cache_filename(cache_dir, roster) for roster in rosters]
+    invalidated = 0
+    for filename in filenames:
+        for path in [filename + ".json", filename]:
+            if os.path.exists(path):
+                os.remove(path)
+                invalidated += path == filename
+    return invalidated
+
+
+def merge_intervals(intervals):
+    """
+    Merges overlapping or touching closed intervals.
+
+    :param (list) intervals: List of (start, end) tuples.
+    :return: Sorted list of disjoint (start, end) tuples.
+    """
+    merged = list()
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def uncovered_intervals(intervals, start, end):
+    """
+    Finds the parts of the closed interval [start, end] not covered by intervals.
+
+    Gaps share their endpoints with the neighbouring covered intervals, so records fetched for a gap may include
+    some already covered (e.g. to be deduplicated by ID).
+
+    :param (list) intervals: List of covered (start, end) tuples.
+    :param start: Start of the interval.
+    :param end: End of the interval.
+    :return: List of uncovered (start, end) tuples.
+    """
+    gaps = list()
+    for covered_start, covered_end in merge_intervals(intervals):
+        if covered_end < start or covered_start > end:
+            continue
+        if covered_start > start:
+            gaps.append((start, covered_start))
+        if covered_end >= end:
+            return gaps
+        start = max(start, covered_end)
+    gaps.append((start, end))
+    return gaps
+
+
+def decode_bookings(batches, decoder=None):
+    """
+    Decodes raw BSON batches of JDI bookings projected by booking_projection into a pandas.DataFrame.
+
+    The "dicts" decoder builds a Python dict per booking and appends its values to column lists. The "arrow" decoder
+    (requires pymongoarrow) appends BSON values straight to typed Arrow column builders, without per-booking objects.
+    Both cast to booking_dtypes, so they return identical frames (see compare_booking_decoders).
+
+    :param (iterable) batches: Raw BSON batches (e.g. from pymongo.collection.Collection.aggregate_raw_batches).
+    :param (str) decoder: Decoder, "dicts" or "arrow" (defaults to the BOOKING_DECODER setting).
+    :return: pandas.DataFrame of bookings with booking_columns.
+    """
+    decoder = decoder or booking_decoder
+    if decoder not in booking_decoders:
+        raise ValueError(f"Unknown booking decoder {decoder} (choose from {booking_decoders}).")
+
+    if decoder == "arrow":
+        import pyarrow as pa
+        from pymongoarrow.api import Schema
+        from pymongoarrow.context import PyMongoArrowContext
+        from pymongoarrow.types import ObjectIdType
+
+        context = PyMongoArrowContext(Schema({
+            "_id": ObjectIdType(),
+            "Name": pa.string(),
+            "Age_Standardized": pa.float64(),
+            "Sex_Gender_Standardized": pa.string(),
+            "Race_Ethnicity_Standardized": pa.string(),
+            "jdi_date_admission": pa.timestamp("ms"),
+            "jdi_date_release": pa.timestamp("ms"),
+            "jdi_id_person": pa.string(),
+            "state": pa.string(),
+            "jail": pa.string(),
+            "jdi_num_charges": pa.int64(),
+            "jdi_charge_types": pa.list_(pa.string()),
+        }))
+        for batch in batches:
+            context.process_bson_stream(batch)
+        bookings = context.finish().to_pandas(coerce_temporal_nanoseconds=True)[booking_columns]
+    else:
+        import bson
+
+        columns = {column: list() for column in booking_columns}
+        for batch in batches:
+            for d in bson.decode_all(batch):
+                for column, values in columns.items():
+                    values.append(d.get(column))
+        bookings = pd.DataFrame(columns)
+
+    bookings = bookings.astype(booking_dtypes)
+    bookings["_id"] = bookings["_id"].astype(str)
+    bookings["jdi_charge_types"] = classify_charge_types(bookings["jdi_charge_types"])
+    return bookings
+
+
+def compare_booking_decoders(batches):
+    """
+    Decodes raw BSON batches with both decoders and raises if the frames differ in any column's values or dtype.
+
+    :param (list) batches: Raw BSON batches of JDI bookings projected by booking_projection.
+    :return: Tuple of the dicts and arrow frames.
+    """
+    reference = decode_bookings(batches, decoder="dicts")
+    frame = decode_bookings(batches, decoder="arrow")
+    checks = {
+        column: reference[column].dtype == frame[column].dtype and reference[column].equals(frame[column])
+        for column in booking_columns
+    }
+    failed = [key for key, passed in checks.items() if not passed]
+    if failed:
+        raise ValueError(f"Booking decoders disagree on {failed}.")
+    return reference, frame
+
+
+def classify_charge_types(charge_types):
+    """
+    Takes pandas.Series of standardized (l1) charge type lists and finds the most severe charge type of each booking.
+
+    Each distinct charge type is coded once by the first charge_severity pattern it contains (patterns are ordered by
+    precedence) and each booking takes its lowest code. Bookings with no charge types or whose most severe code is
+    missing (TBD) are missing, and bookings whose charge types match no pattern keep them joined by ";" (missing if
+    empty).
+
+    :param (pandas.Series) charge_types: pandas.Series of lists (or arrays) of charge types, missing without Charges.
+    :return: Categorical pandas.Series of most severe charge types.
+    """
+    present = charge_types.notna().to_numpy()
+    lists = charge_types[present]
+    lengths = np.fromiter((len(types) for types in lists), dtype=np.int64, count=len(lists))
+    flat = pd.Series(list(itertools.chain.from_iterable(lists)), dtype=object)
+
+    # Code distinct charge types by pattern precedence (len(charge_severity) if unmatched).
+    codes, uniques = pd.factorize(flat)
+    unique_severity = np.array([
+        next((i for i, (pattern, _) in enumerate(charge_severity) if pattern in types), len(charge_severity))
+        for types in uniques
+    ], dtype=np.int64)
+    severity = np.append(unique_severity, len(charge_severity))[codes]
+
+    # Reduce to the lowest code per booking (missing if no charge types).
+    missing = len(charge_severity) + 1
+    lowest = np.full(len(lists), missing, dtype=np.int64)
+    np.minimum.at(lowest, np.repeat(np.arange(len(lists)), lengths), severity)
+
+    labels = np.array([label for _, label in charge_severity] + [None, None], dtype=object)
+    values = labels[lowest]
+    unmatched = np.flatnonzero(lowest == len(charge_severity))
+    values[unmatched] = [";".join(lists.iloc[i]) or None for i in unmatched]
+    most_severe = np.full(len(charge_types), None, dtype=object)
+    most_severe[present] = values
+    return pd.Series(most_severe, index=charge_types.index, dtype="category")
+
+
 def treatment_control_split_full_bookings(base_df, control, treatment_rollback, no_charge, no_bond):
     """
     Takes in a pandas.DataFrame and splits it into Treatment/Control based on input arguments.
@@ -235,7 +1309,7 @@ def treatment_control_split_full_bookings(base_df, control, treatment_rollback,
     """
     # Subset to admissions in range [first voting + treatment_rollback, Election Day + control].
     df = base_df.copy()
-    df = df[df["jdi_date_admission"] >= earliest_voting_date + dt.timedelta(days=treatment_rollback)]
+    df = df[df["jdi_date_admission"] >= get_earliest_voting_date() + dt.timedelta(days=treatment_rollback)]
     df = df[df["jdi_date_admission"] <= election_day + dt.timedelta(days=control)]
 
     # Assign Treatment (T) vs. Control (C).
@@ -245,7 +1319,7 @@ def treatment_control_split_full_bookings(base_df, control, treatment_rollback,
     df = df[df["jdi_date_admission"] >= df["earliest_voting_date"]]
 
     # Set up single person_id on which to deduplicate.
-    df["jdi_id_person_joint"] = df["jail_id"] + "-" + df["jdi_id_person"]
+    df["jdi_id_person_joint"] = df["jail_id"].astype(str) + "-" + df["jdi_id_person"]
 
     # Drop duplicate bookings and ensure mutually exclusive cohorts.
     treatment = df[df["treatment"] == 1]
@@ -268,7 +1342,7 @@ def treatment_control_split_full_bookings(base_df, control, treatment_rollback,
         to_model = to_model[(to_model["jdi_bond"].notna())]
 
     # Assume matched = 0 implies l2_voted_indicator = 0
-    to_model["l2_voted_indicator"] = np.where(to_model["l2_voted_indicator"].isna(), 0, to_model["l2_voted_indicator"])
+    to_model["l2_voted_indicator"] = to_model["l2_voted_indicator"].fillna(0)
 
     # Set week number and re-index in case time effects modeled downstream.
     to_model["week"] = to_model["jdi_date_admission"].dt.isocalendar().week.astype(int)
@@ -276,9 +1350,476 @@ def treatment_control_split_full_bookings(base_df, control, treatment_rollback,
     return to_model
 
 
-# Earliest voting dates by state and overall.
-voting_dates_by_state = pd.read_csv(f"s3://{os.getenv('S3_BUCKET')}/{os.getenv('VOTING_DATES_FILE')}")
-earliest_voting_date = pd.to_datetime(voting_dates_by_state["earliest_voting_date"]).min()
+class SplitIndex:
+    """
+    Precomputed ordering and eligibility of booking records for repeated Treatment/Control splits.
+
+    Rows are ordered once by person and jdi_date_admission, and admission dates, voting-period eligibility,
+    co-variate completeness and week numbers are kept as NumPy arrays in that order. Each split is then a pair of
+    masks plus a deduplication over integer person codes, and only the selected rows of base_df are copied.
+    Splits match treatment_control_split (or treatment_control_split_full_bookings if full_bookings is set).
+    """
+
+    def __init__(self, base_df, no_charge, no_bond, full_bookings=False):
+        """
+        :param (pandas.DataFrame) base_df: pandas.DataFrame of booking records with date columns set to datetime.
+        :param (bool) no_charge: Indicator to exclude records missing charge data.
+        :param (bool) no_bond: Indicator to exclude records missing bond data.
+        :param (bool) full_bookings: Indicator to split full bookings (deduplicated on JDI person) or L2 matches.
+        """
+        self.full_bookings = full_bookings
+        if full_bookings:
+            # Assume matched = 0 implies l2_voted_indicator = 0
+            base_df = base_df.assign(l2_voted_indicator=base_df["l2_voted_indicator"].fillna(0))
+        self.base_df = base_df
+
+        # Order rows as in the deduplication sort and encode people as integers.
+        if full_bookings:
+            person_columns = ["jail_id", "jdi_id_person"]
+            person = base_df["jail_id"].astype(str) + "-" + base_df["jdi_id_person"]
+            co_variates = ["jdi_age", "jdi_gender", "jdi_race"]
+        else:
+            person_columns = ["l2_id"]
+            person = base_df["l2_id"]
+            co_variates = ["l2_age", "l2_gender", "l2_race", "l2_party"]
+        sort_columns = person_columns + ["jdi_date_admission"]
+        self.order = base_df[sort_columns].reset_index(drop=True).sort_values(by=sort_columns).index.to_numpy()
+        self.person = pd.factorize(person.to_numpy()[self.order])[0]
+
+        # Admissions within the voting period of each state.
+        self.admission = base_df["jdi_date_admission"].to_numpy(dtype="datetime64[ns]")[self.order]
+        self.eligible = self.admission >= base_df["earliest_voting_date"].to_numpy(dtype="datetime64[ns]")[self.order]
+
+        # Records with all required co-variates.
+        complete = base_df[co_variates].notna().all(axis=1)
+        if no_charge:
+            complete &= (base_df["jdi_charge_types"].notna()) & (base_df["jdi_num_charges"].notna())
+        if no_bond:
+            complete &= base_df["jdi_bond"].notna()
+        self.complete = complete.to_numpy()[self.order]
+
+        # Week number in case time effects modeled downstream.
+        week = pd.Series(self.admission).dt.isocalendar().week
+        self.week = week.to_numpy(dtype=np.int64, na_value=0)
+
+    def split(self, control, treatment_rollback):
+        """
+        Splits base_df into Treatment/Control for one control window and treatment rollback.
+
+        :param (int) control: Number of days in control window.
+        :param (int) treatment_rollback: Number of days to remove largest voting window.
+        :return: Recombined pandas.DataFrame of Treatment/Control split data.
+        """
+        return rebuild_split(self.base_df, *self.membership(control, treatment_rollback))
+
+    def membership(self, control, treatment_rollback):
+        """
+        Finds the base_df positions, treatment indicators and week numbers of one control window and treatment rollback.
+
+        :param (int) control: Number of days in control window.
+        :param (int) treatment_rollback: Number of days to remove largest voting window.
+        :return: Tuple of numpy.ndarray base_df positions, treatment indicators and week numbers.
+        """
+        rows, treatment = self.split_rows(control, treatment_rollback)
+        return self.order[rows], treatment, self.week[rows]
+
+    def split_rows(self, control, treatment_rollback):
+        """
+        Finds sorted row positions and treatment indicators for one control window and treatment rollback.
+
+        :param (int) control: Number of days in control window.
+        :param (int) treatment_rollback: Number of days to remove largest voting window.
+        :return: Tuple of numpy.ndarray row positions (into the sorted order) and treatment indicators.
+        """
+        # Subset to admissions in range [first voting + treatment_rollback, Election Day + control].
+        earliest = np.datetime64(get_earliest_voting_date() + dt.timedelta(days=treatment_rollback), "ns")
+        latest = np.datetime64(election_day + dt.timedelta(days=control), "ns")
+        in_window = self.eligible & (self.admission >= earliest) & (self.admission <= latest)
+        treated = self.admission <= np.datetime64(election_day, "ns")
+
+        # Keep each person's latest booking and ensure mutually exclusive cohorts.
+        treatment = self.last_per_person(np.flatnonzero(in_window & treated))
+        control = self.last_per_person(np.flatnonzero(in_window & ~treated))
+        control = control[~np.isin(self.person[control], self.person[treatment])]
+
+        # Filter to exclude rows missing co-variates.
+        rows = np.concatenate([treatment, control])
+        indicators = np.repeat(np.array([1, 0]), [len(treatment), len(control)])
+        complete = self.complete[rows]
+        return rows[complete], indicators[complete]
+
+    def rollback_rows(self, control, n_rollbacks):
+        """
+        Finds the records of every treatment rollback in [0, n_rollbacks) for one control window at once.
+
+        Rolling back only drops early admissions, so each person's kept treatment booking is unchanged until it is
+        rolled back, after which their kept control booking (if any) joins. Each record therefore belongs to a
+        contiguous range of rollbacks, and split_rows(control, rollback) holds the records whose range covers it.
+
+        :param (int) control: Number of days in control window.
+        :param (int) n_rollbacks: Number of treatment rollback days (0 to n_rollbacks - 1).
+        :return: Tuple of numpy.ndarray row positions, treatment indicators, first and last rollbacks.
+        """
+        earliest = np.datetime64(get_earliest_voting_date(), "ns")
+        latest = np.datetime64(election_day + dt.timedelta(days=control), "ns")
+        in_window = self.eligible & (self.admission >= earliest) & (self.admission <= latest)
+        treated = self.admission <= np.datetime64(election_day, "ns")
+        treatment = self.last_per_person(np.flatnonzero(in_window & treated))
+        control = self.last_per_person(np.flatnonzero(in_window & ~treated))
+
+        # Records stay until the rollback passes their admission date.
+        day = np.timedelta64(1, "D")
+        last_treatment = (self.admission[treatment] - earliest) // day
+        last_control = (self.admission[control] - earliest) // day
+
+        # Control records join once the person's treatment booking has been rolled back.
+        rolled_back = pd.Series(last_treatment + 1, index=self.person[treatment])
+        first_control = rolled_back.reindex(self.person[control]).fillna(0).to_numpy(dtype=np.int64)
+
+        rows = np.concatenate([treatment, control])
+        indicators = np.repeat(np.array([1, 0]), [len(treatment), len(control)])
+        first = np.concatenate([np.zeros(len(treatment), dtype=np.int64), first_control])
+        last = np.minimum(np.concatenate([last_treatment, last_control]), n_rollbacks - 1)
+        keep = self.complete[rows] & (first <= last)
+        return rows[keep], indicators[keep], first[keep], last[keep]
+
+    def last_per_person(self, rows):
+        """
+        Keeps the last of the given sorted row positions for each person (i.e. their latest admission).
+
+        :param (numpy.ndarray) rows: Increasing row positions into the sorted order.
+        :return: numpy.ndarray of row positions.
+        """
+        return rows[~pd.Series(self.person[rows]).duplicated(keep="last").to_numpy()]
+
+
+def balance_by_rollback(split_index, control, n_rollbacks, co_variates):
+    """
+    Fits treatment ~ co_variates + EntityEffects for every treatment rollback of one control window in one pass.
+
+    Consecutive rollbacks differ by the few records entering or leaving (see SplitIndex.rollback_rows), so the
+    pooled cross-products and per-jail sums and cross-products are updated incrementally and each rollback's
+    within-jail estimates, entity-clustered co-variance and joint F-test (as in utils.model) come from those running
+    sums rather than a refit.
+
+    :param (SplitIndex) split_index: Split index over the base pandas.DataFrame.
+    :param (int) control: Number of days in control window.
+    :param (int) n_rollbacks: Number of treatment rollback days (0 to n_rollbacks - 1).
+    :param (list) co_variates: Balance co-variates (independent variables).
+    :return: List of dicts of rollback days, observations, params, F-statistic, p-value and FitSummary.
+    """
+    from scipy import stats
+
+    rows, treatment, first, last = split_index.rollback_rows(control, n_rollbacks)
+
+    # Drop records missing any modeled value, as PanelOLS does, and center for numerical stability.
+    frame = split_index.base_df.take(split_index.order[rows])
+    values = np.column_stack([
+        frame[co_variates].to_numpy(dtype=np.float64, na_value=np.nan), treatment.astype(np.float64)
+    ])
+    complete = ~np.isnan(values).any(axis=1)
+    values, first, last = values[complete], first[complete], last[complete]
+    values -= values.mean(axis=0) if len(values) else 0
+    jail, jails = pd.factorize(frame["jail_id"].to_numpy()[complete])
+    k, n_jails = len(co_variates), len(jails)
+
+    # Records entering at each rollback (by first) and leaving after the previous one (by last).
+    entering, leaving = np.argsort(first, kind="stable"), np.argsort(last, kind="stable")
+    entering_at = np.searchsorted(first[entering], np.arange(n_rollbacks + 1))
+    leaving_at = np.searchsorted(last[leaving], np.arange(-1, n_rollbacks))
+
+    counts = np.zeros(n_jails)
+    sums = np.zeros((n_jails, k + 1))
+    cross = np.zeros((k + 1, k + 1))
+    jail_cross = np.zeros((n_jails, k + 1, k + 1))
+    fits = list()
+    for rollback in range(n_rollbacks):
+        for records, sign in [
+            (entering[entering_at[rollback]:entering_at[rollback + 1]], 1),
+            (leaving[leaving_at[rollback]:leaving_at[rollback + 1]], -1),
+        ]:
+            counts += sign * np.bincount(jail[records], minlength=n_jails)
+            sums += sign * group_sums(values[records], jail[records], n_jails)
+            cross += sign * values[records].T @ values[records]
+            jail_cross += sign * group_cross_products(values[records], jail[records], n_jails)
+
+        # Within-jail cross-products, estimates and homoskedastic joint F-test.
+        present = counts > 0
+        within = cross - sums[present].T @ (sums[present] / counts[present, None])
+        nobs = int(round(counts.sum()))
+        df_resid = nobs - k - int(present.sum())
+        if np.linalg.matrix_rank(within[:k, :k]) < k:
+            raise ValueError(f"Independent variables are collinear or absorbed by fixed effects: {co_variates}.")
+        params = np.linalg.solve(within[:k, :k], within[:k, k])
+        resid_ss = within[k, k] - within[:k, k] @ params
+        stat = ((within[k, k] - resid_ss) / k) / (resid_ss / df_resid) if resid_ss > 0 else 0.0
+        p_value = float(stats.f.sf(stat, k, df_resid))
+
+        # Entity-clustered co-variance from each jail's within-jail score total (x'y - x'x params).
+        jail_within = jail_cross[present] - np.einsum(
+            "gj,gk->gjk", sums[present], sums[present] / counts[present, None]
+        )
+        scores = jail_within[:, :k, k] - jail_within[:, :k, :k] @ params
+        xpxi = np.linalg.inv(within[:k, :k])
+        cov = xpxi @ (scores.T @ scores) @ xpxi * nobs / (nobs - k)
+        std_errors = np.sqrt(np.diag((cov + cov.T) / 2))
+        fits.append({
+            "rollback_days": rollback,
+            "observations": nobs,
+            "params": pd.Series(params, index=co_variates, name="parameter"),
+            "f_statistic": stat,
+            "p_value": p_value,
+            "fit": FitSummary(
+                params=pd.Series(params, index=co_variates, name="parameter"),
+                std_errors=pd.Series(std_errors, index=co_variates, name="std_error"),
+                pvalues=pd.Series(
+                    2 * stats.t.sf(np.abs(params / std_errors), df_resid), index=co_variates, name="pvalue"
+                ),
+                nobs=nobs,
+                f_statistic=FTest(stat, p_value, k, df_resid),
+            ),
+        })
+    return fits
+
+
+def select_experimental_windows(splits_df):
+    """
+    Finds the experimental window of each control window from its balance checks: treatment starts the day after
+    the latest imbalanced (p-value <= 0.1) earliest date, or at the earliest date if none is imbalanced.
+
+    :param (pandas.DataFrame) splits_df: pandas.DataFrame of control_days, earliest_date and p_value by split.
+    :return: pandas.DataFrame of control_days, earliest_viable_date and treatment_days.
+    """
+    # Get the earliest date by control window.
+    controls = splits_df.groupby("control_days")["earliest_date"].min().reset_index()
+
+    # Find the earliest date after which all p-values are <= 0.1 by control window.
+    imbalanced = splits_df[splits_df["p_value"] <= 0.1]
+    imbalanced = imbalanced.groupby("control_days")["earliest_date"].max().reset_index()
+    imbalanced["earliest_date"] = pd.to_datetime(imbalanced["earliest_date"])
+    imbalanced["earliest_date"] = imbalanced["earliest_date"].apply(lambda d: d + dt.timedelta(days=1))
+    imbalanced = imbalanced.rename(columns={"earliest_date": "earliest_viable_date"})
+    treatment_ranges = pd.merge(controls, imbalanced, how="left", on="control_days")
+    treatment_ranges["earliest_viable_date"] = np.where(
+        treatment_ranges["earliest_viable_date"].isna(),
+        treatment_ranges["earliest_date"],
+        treatment_ranges["earliest_viable_date"]
+    )
+    treatment_ranges = treatment_ranges.drop(columns=["earliest_date"])
+    treatment_ranges["earliest_viable_date"] = pd.to_datetime(treatment_ranges["earliest_viable_date"])
+    treatment_ranges["treatment_days"] = (election_day - treatment_ranges["earliest_viable_date"]).dt.days
+    return treatment_ranges
+
+
+def split_filename(input_dir, control, treatment):
+    """
+    Builds the filename of one Treatment/Control split membership written by the balance iterator.
+
+    :param (str) input_dir: Balance iteration directory of a configuration (e.g. out/balance_iteration/<combo>).
+    :param (int) control: Number of days in control window.
+    :param (int) treatment: Number of days in treatment window.
+    :return: String filename of split membership file.
+    """
+    return f"{input_dir}/c_{control}/t_{treatment}.npz"
+
+
+def save_fit_summaries(summaries, output_dir):
+    """
+    Writes the balance fit of every Treatment/Control split of a configuration, so it is read rather than refit.
+
+    :param (dict) summaries: Fit summaries (from summarize_fit) by (control, treatment) tuple.
+    :param (str) output_dir: Balance iteration directory of a configuration.
+    """
+    with open(f"{output_dir}/fit_summaries.json", "w") as summaries_json:
+        json.dump({
+            f"c_{control}/t_{treatment}": summary for (control, treatment), summary in summaries.items()
+        }, summaries_json)
+
+
+def load_fit_summaries(input_dir):
+    """
+    Reads the balance fits of the Treatment/Control splits of a configuration written by save_fit_summaries.
+
+    :param (str) input_dir: Balance iteration directory of a configuration.
+    :return: Dict of FitSummary by (control, treatment) tuple.
+    """
+    with open(f"{input_dir}/fit_summaries.json", "r") as summaries_json:
+        summaries = json.load(summaries_json)
+    fits = dict()
+    for key, summary in summaries.items():
+        control, treatment = key.split("/")
+        fits[(int(control.removeprefix("c_")), int(treatment.removeprefix("t_")))] = fit_from_summary(summary)
+    return fits
+
+
+def save_split_manifest(output_dir):
+    """
+    Writes the SHA-256 digest of every Treatment/Control split membership file of a configuration, so stages reading
+    splits (see pipeline.py) rerun when any membership changes.
+
+    :param (str) output_dir: Balance iteration directory of a configuration.
+    :return: String filename of split manifest.
+    """
+    digests = dict()
+    for filename in sorted(glob.glob(f"{output_dir}/c_*/t_*.npz")):
+        with open(filename, "rb") as split:
+            digests[os.path.relpath(filename, output_dir)] = hashlib.sha256(split.read()).hexdigest()
+    filename = split_manifest_filename(output_dir)
+    with open(filename, "w") as manifest_json:
+        json.dump(digests, manifest_json, indent=0, sort_keys=True)
+    return filename
+
+
+def split_manifest_filename(input_dir):
+    """
+    Builds the filename of the digests of the Treatment/Control split membership files of a configuration.
+
+    :param (str) input_dir: Balance iteration directory of a configuration.
+    :return: String filename of split manifest.
+    """
+    return f"{input_dir}/splits.json"
+
+
+def split_base_filename(input_dir):
+    """
+    Builds the filename of the base booking records shared by all Treatment/Control splits of a configuration.
+
+    :param (str) input_dir: Balance iteration directory of a configuration.
+    :return: String filename of base Parquet file.
+    """
+    return f"{input_dir}/base.parquet"
+
+
+def split_base_columns(input_dir):
+    """
+    Lists the columns of the base booking records written by save_split_base without reading them.
+
+    :param (str) input_dir: Balance iteration directory of a configuration.
+    :return: List of column names.
+    """
+    base_df = cached_frame(split_base_filename(input_dir))
+    if base_df is not None:
+        return list(base_df.columns)
+    import pyarrow.parquet as pq
+    return pq.read_schema(split_base_filename(input_dir)).names
+
+
+def save_split_base(base_df, output_dir):
+    """
+    Writes the base booking records of all Treatment/Control splits to compressed Parquet, keeping column dtypes.
+
+    :param (pandas.DataFrame) base_df: pandas.DataFrame of booking records (e.g. SplitIndex.base_df).
+    :param (str) output_dir: Balance iteration directory of a configuration.
+    :return: String filename of base Parquet file.
+    """
+    filename = split_base_filename(output_dir)
+    base_df.to_parquet(filename, index=False, compression=split_compression)
+    cache_frame(filename, base_df)
+    return filename
+
+
+def save_split(membership, output_dir, control, treatment):
+    """
+    Writes one Treatment/Control split as its rows of the base records, treatment indicators and week numbers.
+
+    :param (tuple) membership: Tuple of numpy.ndarray base positions, treatment and week (see SplitIndex.membership).
+    :param (str) output_dir: Balance iteration directory of a configuration.
+    :param (int) control: Number of days in control window.
+    :param (int) treatment: Number of days in treatment window.
+    :return: String filename of split membership file.
+    """
+    rows, indicators, week = membership
+    filename = split_filename(output_dir, control, treatment)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    np.savez_compressed(filename, rows=rows, treatment=indicators, week=week)
+    return filename
+
+
+def load_split_base(input_dir, columns=None):
+    """
+    Reads the base booking records written by save_split_base, optionally reading only the given columns.
+
+    :param (str) input_dir: Balance iteration directory of a configuration.
+    :param (list) columns: Columns to read (jail_id is always read), or None to read all columns.
+    :return: pandas.DataFrame of base booking records.
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(["jail_id"] + [column for column in columns if column != "treatment"]))
+    base_df = cached_frame(split_base_filename(input_dir))
+    if base_df is not None:
+        return base_df if columns is None else base_df[columns]
+    return pd.read_parquet(split_base_filename(input_dir), columns=columns)
+
+
+def load_split(input_dir, control, treatment, columns=None, base_df=None):
+    """
+    Rebuilds one Treatment/Control split from the base booking records and the split membership.
+
+    :param (str) input_dir: Balance iteration directory of a configuration.
+    :param (int) control: Number of days in control window.
+    :param (int) treatment: Number of days in treatment window.
+    :param (list) columns: Columns to read (jail_id and treatment are always kept), or None to read all columns.
+    :param (pandas.DataFrame) base_df: Base booking records already read by load_split_base (read if None).
+    :return: pandas.DataFrame of Treatment/Control split data indexed by jail_id and week.
+    """
+    if base_df is None:
+        base_df = load_split_base(input_dir, columns=columns)
+    with np.load(split_filename(input_dir, control, treatment)) as membership:
+        return rebuild_split(base_df, membership["rows"], membership["treatment"], membership["week"])
+
+
+def file_signature(filename):
+    """
+    Takes a filename and returns its size and modification time, which change whenever it is rewritten.
+
+    :param (str) filename: Path to file.
+    :return: Tuple of integer size in bytes and modification time in nanoseconds.
+    """
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def cache_frame(filename, df):
+    """
+    Keeps a pandas.DataFrame just written to filename in memory, so stages run later in the same process (e.g. by
+    pipeline.py) can skip reading it back.
+
+    :param (str) filename: Path to which df was written.
+    :param (pandas.DataFrame) df: pandas.DataFrame written to filename.
+    """
+    frame_cache[os.path.abspath(filename)] = (file_signature(filename), df)
+
+
+def cached_frame(filename):
+    """
+    Returns the in-memory pandas.DataFrame kept by cache_frame, if the file has not been rewritten since.
+
+    :param (str) filename: Path to file.
+    :return: pandas.DataFrame, or None if not in memory or stale.
+    """
+    entry = frame_cache.get(os.path.abspath(filename))
+    if entry is None or not os.path.exists(filename) or entry[0] != file_signature(filename):
+        return None
+    return entry[1]
+
+
+def rebuild_split(base_df, rows, treatment, week):
+    """
+    Takes rows of the base booking records and adds treatment indicators and week numbers.
+
+    :param (pandas.DataFrame) base_df: pandas.DataFrame of base booking records.
+    :param (numpy.ndarray) rows: Positions of split records in base_df.
+    :param (numpy.ndarray) treatment: Treatment indicators of split records.
+    :param (numpy.ndarray) week: Week numbers of split records.
+    :return: pandas.DataFrame of Treatment/Control split data indexed by jail_id and week.
+    """
+    to_model = base_df.take(rows)
+    to_model["treatment"] = treatment.astype(np.int64)
+
+    # Set week number and re-index in case time effects modeled downstream.
+    to_model["week"] = week.astype(np.int64)
+    to_model = to_model.set_index(["jail_id", "week"])
+    return to_model
 
 
 # Election Day 2020 (November 3rd).
@@ -322,6 +1863,167 @@ dummy_columns = [
 ]
 
 
+# Compact dtypes of booking record columns (see set_dtypes; continuous columns stay float64 as they are persisted);
+# l2_voted_indicator_{year} columns are Int8 and dummy columns are boolean.
+column_dtypes = {
+    "jail": "category",
+    "jail_id": "category",
+    "jdi_age": np.float64,
+    "jdi_bond": np.float64,
+    "jdi_charge_types": "category",
+    "jdi_gender": "category",
+    "jdi_length_of_stay": "Int16",
+    "jdi_num_charges": np.float64,
+    "jdi_race": "category",
+    "l2_active": "Int8",
+    "l2_age": np.float64,
+    "l2_gender": "category",
+    "l2_party": "category",
+    "l2_race": "category",
+    "l2_voted_indicator": "Int8",
+    "matched": "Int8",
+    "matched_registered": "Int8",
+    "state": "category",
+    "votable_days": "Int16",
+    "votable_days_in_custody": "Int16"
+}
+
+
+# Estimation engines available to utils.model (PanelOLS or the NumPy within estimator) and the default.
+model_engines = ["linearmodels", "numpy"]
+model_engine = os.getenv("MODEL_ENGINE", "linearmodels")
+
+
+# Local cache of S3 files, its gzip compression level, and settings to read a local stand-in for the bucket or
+# cached copies without checking S3.
+s3_cache_dir = os.getenv("S3_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "out/s3_cache"))
+s3_cache_compression = 6
+s3_local_dir = os.getenv("S3_LOCAL_DIR")
+s3_offline = os.getenv("S3_OFFLINE", "").lower() in ["1", "true", "yes"]
+
+
+# Local cache of JDI bookings by roster (see read_cached_bookings) and the version of its format (cached bookings of
+# other versions are collected again).
+bookings_cache_dir = os.getenv(
+    "BOOKINGS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "out/bookings_cache")
+)
+bookings_cache_version = 2
+
+
+# Local cache of L2 votes per ballot return date by state (see graph_l2_early_voting_distribution.py).
+early_voting_cache_filename = os.getenv(
+    "EARLY_VOTING_CACHE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "out/l2_cache/early_voting_by_state.csv")
+)
+
+
+# Rows per chunk when streaming CSV files from S3 (see read_s3_csv_chunks).
+csv_chunk_size = int(os.getenv("CSV_CHUNK_SIZE", 250000))
+
+
+# Prepped superset of matched records (relative to matched_bookings) above a match probability threshold on either
+# score column, and its per-record flag columns (see prepped_view; jail-level exclusions depend on the records kept,
+# so they are not flagged).
+prepped_superset_threshold = float(os.getenv("PREPPED_SUPERSET_THRESHOLD", 0.5))
+prepped_superset_filename = f"out/prepped_data/superset_t_{prepped_superset_threshold}.csv"
+prepped_flag_columns = ["flag_active", "flag_registered"]
+
+
+# Columns of the match file used by the pipeline (with any l2_voted_indicator_{year} placebo columns).
+match_columns = [
+    "jail",
+    "jail_first_scrape_date",
+    "jail_id",
+    "jdi_age",
+    "jdi_bond",
+    "jdi_charge_types",
+    "jdi_date_admission",
+    "jdi_date_release",
+    "jdi_full_name",
+    "jdi_gender",
+    "jdi_id_booking",
+    "jdi_id_person",
+    "jdi_num_charges",
+    "jdi_race",
+    "l2_active",
+    "l2_age",
+    "l2_date_registered_calculated",
+    "l2_gender",
+    "l2_id",
+    "l2_party",
+    "l2_race",
+    "l2_voted_indicator",
+    "score_unweighted",
+    "score_weighted",
+    "state"
+]
+
+
+# Explicit dtypes of match file columns (dates are parsed after filtering).
+match_column_dtypes = {
+    "jail": str,
+    "jail_id": str,
+    "jdi_age": np.float64,
+    "jdi_bond": np.float64,
+    "jdi_charge_types": str,
+    "jdi_full_name": str,
+    "jdi_gender": str,
+    "jdi_id_booking": str,
+    "jdi_id_person": str,
+    "jdi_num_charges": np.float64,
+    "jdi_race": str,
+    "l2_active": np.float64,
+    "l2_age": np.float64,
+    "l2_gender": str,
+    "l2_id": str,
+    "l2_party": str,
+    "l2_race": str,
+    "l2_voted_indicator": np.float64,
+    "score_unweighted": np.float64,
+    "score_weighted": np.float64,
+    "state": str
+}
+
+
+# Directory of cached model fits (unset disables caching) and its maximum size in bytes.
+model_cache_dir = os.getenv("MODEL_CACHE_DIR")
+model_cache_size = int(os.getenv("MODEL_CACHE_SIZE", 64 * 1024 ** 2))
+
+
+# Executors available to utils.thread.
+parallel_backends = ["threads", "processes", "serial"]
+
+
+# Worker run by process pools in utils.thread.
+_pool_worker = None
+
+
+# Compression codec of Treatment/Control split Parquet files.
+split_compression = "zstd"
+
+
+# In-memory pandas.DataFrames by absolute filename and file signature (see cache_frame).
+frame_cache = dict()
+
+
+# Configurations run by pipeline.py (as in execute.sh); full configurations model full JDI bookings.
+pipeline_configurations = [
+    {"active": False, "column": "score_weighted", "registered": True, "threshold": 0.75,
+     "exclude_no_bond": False, "exclude_no_charge": True, "full": False},
+    {"active": False, "column": "score_weighted", "registered": True, "threshold": 0.95,
+     "exclude_no_bond": False, "exclude_no_charge": True, "full": False},
+    {"active": False, "column": "score_weighted", "registered": False, "threshold": 0.95,
+     "exclude_no_bond": False, "exclude_no_charge": True, "full": True},
+]
+
+
+# CPUs used by pipeline stages (by script, otherwise 1; also passed as -n to balance_iterator.py) and their estimated
+# peak memory per byte of largest input.
+pipeline_stage_cpus = {"balance_iterator.py": 4}
+pipeline_memory_factor = 5
+pipeline_memory_minimum = 512 * 1024 ** 2
+
+
 # Control windows (multiples of 7).
 control_windows = list(7 * n for n in range(1, 7))
 
@@ -352,6 +2054,13 @@ balance_co_variates = [
 turnout_co_variates = balance_co_variates + ["jdi_length_of_stay"]
 
 
+# Turnout designs (independent variable and co-variate setting) modeled in each threshold sweep window.
+turnout_designs = [
+    ("treatment", "no_co_variates"), ("treatment", "co_variates"),
+    ("pct_votable_days_in_custody", "no_co_variates"), ("pct_votable_days_in_custody", "co_variates")
+]
+
+
 # Heterogeneity co-variates.
 turnout_heterogeneity_co_variates = list(set(turnout_co_variates).difference({"l2_race_White", "l2_race_Black"}))
 
@@ -430,18 +2139,70 @@ table_sorter = [
 ]
 
 
-# JDI fields to collect for full booking data collection.
-fields = [
-    "_id",
-    "meta",
-    "Name",
-    "Age_Standardized",
-    "Sex_Gender_Standardized",
-    "Race_Ethnicity_Standardized",
-    "Charges.Charge_Standardized"
+# JDI fields to collect for full booking data collection, projected to flat columns server-side: charges are counted
+# and their standardized (l1) types listed (both omitted if a booking has no Charges array) for classification by
+# classify_charge_types.
+booking_projection = {
+    "_id": 1,
+    "Name": 1,
+    "Age_Standardized": 1,
+    "Sex_Gender_Standardized": 1,
+    "Race_Ethnicity_Standardized": 1,
+    "jdi_date_admission": "$meta.first_seen",
+    "jdi_date_release": "$meta.last_seen",
+    "jdi_id_person": "$meta.jdi_inmate_id",
+    "state": "$meta.State",
+    "jail": "$meta.County",
+    "jdi_num_charges": {"$cond": [{"$isArray": "$Charges"}, {"$size": "$Charges"}, "$$REMOVE"]},
+    "jdi_charge_types": {"$cond": [
+        {"$isArray": "$Charges"},
+        {"$map": {
+            "input": {"$filter": {
+                "input": "$Charges",
+                "as": "charge",
+                "cond": {"$ne": [{"$type": "$$charge.Charge_Standardized"}, "missing"]},
+            }},
+            "as": "charge",
+            "in": "$$charge.Charge_Standardized.l1",
+        }},
+        "$$REMOVE",
+    ]},
+}
+
+
+# Columns of collected JDI bookings and the number of documents per cursor batch.
+booking_columns = list(booking_projection)
+booking_batch_size = 5000
+
+
+# Charge type patterns in order of severity and the most severe charge type they map to (missing for TBD).
+charge_severity = [
+    ("Violent", "violent"),
+    ("Property", "property"),
+    ("Drug", "drug"),
+    ("Public Order", "public order"),
+    ("DUI", "dui"),
+    ("Criminal traffic", "criminal traffic"),
+    ("TBD", None)
 ]
 
 
+# Decoders of collected JDI bookings available to utils.decode_bookings, the default (arrow if pymongoarrow is
+# installed) and the dtypes both decode numeric and date columns to.
+booking_decoders = ["dicts", "arrow"]
+booking_decoder = os.getenv("BOOKING_DECODER") or ("arrow" if importlib.util.find_spec("pymongoarrow") else "dicts")
+booking_dtypes = {
+    "Age_Standardized": "float64",
+    "jdi_date_admission": "datetime64[ns]",
+    "jdi_date_release": "datetime64[ns]",
+    "jdi_num_charges": "float64",
+}
+
+
+# Number of bookings above which a roster's query is split into meta.first_seen sub-ranges (counted up to one more).
+booking_task_size = 20000
+
+
 # Columns to check when merging full booking data with existing match records.
 merge_check_fields = [
     "jail",